@@ -0,0 +1,579 @@
+
+"""
+dbTable benchmarks.
+
+>> python benchmark.py scaling --sizes 1000 10000 100000 --ops 200 --segment-size 100 --mapped-segments 0
+
+per-operation latency while a table grows, tables are made in a temporary directory and removed at the end,
+each size is filled with Generate.insert_many and then Extract.find, Extract.check and Extract.update
+are timed on random rows, --mapped-segments reads the rows through the offset tables of that many _D_ files.
+
+>> python benchmark.py codecs --columns 50 --rows 200
+
+write (encode + encrypt) and read (decrypt + decode) latency per row for every record codec.
+
+>> python benchmark.py ciphers --size 65536 --rounds 20
+
+encryption and decryption throughput (MB/s) and size on disk for every cipher.
+
+>> python benchmark.py readers --processes 1 2 4 8 --rows 10000 --seconds 2
+
+finds per second of the whole machine with 1, 2, 4 and 8 reader processes on the same table,
+the readers share the table's lock so the throughput grows with the number of cores.
+
+>> python benchmark.py writes --rows 2000 --batch 100
+
+inserted rows per second, one insert per call (a transaction each), inserts grouped in
+transactions of --batch rows (one fsync each) and insert_many.
+
+>> python benchmark.py scan --rows 100000 --processes 1 2 4 8 --cell-size 100
+
+rows per second of a full-table Extract.scan (decrypt, decode, where and function in every _D_ file)
+with 1, 2, 4 and 8 worker processes, against Extract.select in this process.
+
+>> python benchmark.py groups --rows 1000 --cell-size 10000 --ops 200
+
+find and update latency of a small "hot" column next to a --cell-size "blob" column, in a table
+of one column group and in a table with column_groups=("blob",), with the bytes decrypted and
+written per operation (Stats phases), --mapped-segments sets Extract's mapped_segments for both tables
+(by default the grouped table reads its rows through the offset tables and the other one doesn't).
+
+>> python benchmark.py compression --rows 10000 --cell-size 200
+
+bytes of the _D_ files (after compact) of a table of repetitive text cells with every compression, and zlib
+with the per-segment dictionary, as a ratio of the uncompressed table, and rows per second of a
+full-table Extract.select.
+
+>> python benchmark.py bulk --rows 20000
+
+rows per second of Extract.export_csv, export_jsonl and Generate.import_csv, import_jsonl of a whole table,
+against a row_stringify loop over fetchall_rows and an insert per row.
+
+>> python benchmark.py rekey --rows 20000
+
+rows per second of Extract.compact and Extract.rekey of a table where half of the rows were dropped
+and the others updated, against a copy of the rows into a table with the new key (select and insert_many),
+with the bytes of the _D_ files and the longest Extract.find of a reader thread during each one
+(the reader of rekey stops when the new files are in place, it has the old key).
+
+>> python benchmark.py suite --rows 1000 --columns 4 --cell-size 16 --ops 200 --output results.json
+
+every public operation (Generate.insert, Extract.find, check, update, remove, drop_row, fetchall_rows,
+len(), tables and drop_table) on a table of --rows rows of --columns cells of --cell-size characters,
+as JSON: ops/s, p50 and p99 latency, the table's bytes on disk after the operation and the file
+system calls per operation (open, chmod, remove, replace... counted with audit hooks, sys.addaudithook).
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import operator
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import dbTable
+from dbTable import Extract, Generate, Table
+
+
+def _timed(function, arguments):
+    # returns the mean latency of function(*args) in microseconds
+    start = time.perf_counter()
+    for args in arguments:
+        function(*args)
+    return (time.perf_counter() - start) / len(arguments) * 1e6
+
+
+def scaling(sizes, ops, segment_size, columns=4, mapped_segments=0):
+    columns_ = tuple(f"column-{i}" for i in range(columns))
+    results = []
+    db_path = tempfile.mkdtemp()
+    try:
+        conn = Generate(db_path=db_path, table_name="benchmark", columns=columns_, segment_size=segment_size)
+        rows = 0
+        for size in sorted(sizes):
+            conn.insert_many((f"row-{i}", columns_, tuple(f"data-{i}-{c}" for c in range(columns)))
+                             for i in range(rows, size))
+            rows = size
+
+            table = Extract(db_path=db_path, table_name="benchmark", mapped_segments=mapped_segments)
+            sample = [f"row-{random.randrange(size)}" for _ in range(ops)]
+            results.append({
+                "rows": size,
+                "find_us": _timed(table.find, [(row, columns_[0]) for row in sample]),
+                "check_us": _timed(table.check, [(row,) for row in sample]),
+                "update_us": _timed(lambda row: table.update(data="updated", row=row, column=columns_[0]),
+                                    [(row,) for row in sample]),
+            })
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def codecs(columns, rows):
+    results = []
+    data = [{f"row-{i}": {f"column-{c}": f"data-{i}-{c}" for c in range(columns)}} for i in range(rows)]
+    db_path = tempfile.mkdtemp()
+    try:
+        for name in dbTable._codecs:
+            writer = dbTable._Insert(db_path=db_path, table_name="benchmark", codec=name)
+            encrypted = [(writer.encode(row),) for row in data]
+            results.append({
+                "codec": name,
+                "bytes_per_row": sum(len(row[0]) for row in encrypted) / rows,
+                "dumps_us": _timed(writer.codec.dumps, [(row,) for row in data]),
+                "loads_us": _timed(writer.codec.loads, [(writer.codec.dumps(row),) for row in data]),
+                "write_us": _timed(writer.encode, [(row,) for row in data]),
+                "read_us": _timed(writer.decode, encrypted),
+            })
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def ciphers(size, rounds):
+    results = []
+    payload = bytes(random.randrange(32, 127) for _ in range(size))
+    for name, cipher in dbTable._ciphers.items():
+        encrypted = cipher.encrypt(payload, dbTable.default_key, "latin-1")
+        encrypt_us = _timed(cipher.encrypt, [(payload, dbTable.default_key, "latin-1")] * rounds)
+        decrypt_us = _timed(cipher.decrypt, [(encrypted, dbTable.default_key, "latin-1")] * rounds)
+        results.append({
+            "cipher": name,
+            "size_ratio": len(encrypted) / size,
+            "encrypt_mb_s": size / encrypt_us,
+            "decrypt_mb_s": size / decrypt_us,
+        })
+    return results
+
+
+def _reader(db_path, rows, seconds, start, counts):
+    table = Extract(db_path=db_path, table_name="benchmark")
+    sample = [f"row-{random.randrange(rows)}" for _ in range(1000)]
+    start.wait()
+    count, stop = 0, time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        table.find(sample[count % len(sample)], "column-0")
+        count += 1
+    counts.put(count)
+
+
+def readers(processes, rows, seconds):
+    results = []
+    db_path = tempfile.mkdtemp()
+    try:
+        Generate(db_path=db_path, table_name="benchmark", columns=("column-0", "column-1")).insert_many(
+            (f"row-{i}", ("column-0", "column-1"), (f"data-{i}", i)) for i in range(rows))
+        for n in processes:
+            start, counts = multiprocessing.Barrier(n), multiprocessing.Queue()
+            workers = [multiprocessing.Process(target=_reader, args=(db_path, rows, seconds, start, counts))
+                       for _ in range(n)]
+            for worker in workers:
+                worker.start()
+            total = sum(counts.get() for _ in workers)
+            for worker in workers:
+                worker.join()
+            results.append({"processes": n, "finds_s": total / seconds, "finds_s_process": total / seconds / n})
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def _scan_value(row, cells):
+    return cells["column-1"]
+
+
+def _scan_where(cells):
+    return cells["column-1"] % 2 == 0
+
+
+def scan(rows, processes, cell_size):
+    results = []
+    db_path = tempfile.mkdtemp()
+    try:
+        Generate(db_path=db_path, table_name="benchmark", columns=("column-0", "column-1")).insert_many(
+            (f"row-{i}", ("column-0", "column-1"), ("x" * cell_size, i)) for i in range(rows))
+        table = Extract(db_path=db_path, table_name="benchmark")
+        start = time.perf_counter()
+        expected = sum(_scan_value(row, cells) for row, cells in table.select(where=_scan_where))
+        results.append({"mode": "select", "rows_s": rows / (time.perf_counter() - start)})
+        for n in processes:
+            start = time.perf_counter()
+            total = table.scan(_scan_value, where=_scan_where, reduce=operator.add, processes=n)
+            results.append({"mode": f"scan x{n}", "rows_s": rows / (time.perf_counter() - start)})
+            assert total == expected
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def writes(rows, batch):
+    results = []
+    columns = ("column-0", "column-1")
+    db_path = tempfile.mkdtemp()
+    try:
+        def insert(table, name):
+            for i in range(rows):
+                table.insert(data=(f"data-{i}", i), row=f"row-{i}", columns=columns)
+
+        def transactions(table, name):
+            for start in range(0, rows, batch):
+                with table.transaction():
+                    for i in range(start, min(start + batch, rows)):
+                        table.insert(data=(f"data-{i}", i), row=f"row-{i}", columns=columns)
+
+        def insert_many(table, name):
+            table.insert_many((f"row-{i}", columns, (f"data-{i}", i)) for i in range(rows))
+
+        for name, function in (("insert", insert), ("transaction", transactions), ("insert_many", insert_many)):
+            table = Table(db_path=db_path, table_name=name, columns=columns)
+            start = time.perf_counter()
+            function(table, name)
+            results.append({"mode": name, "rows_s": rows / (time.perf_counter() - start)})
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def groups(rows, cell_size, ops, mapped_segments=None):
+    results = []
+    columns = ("hot", "blob")
+    db_path = tempfile.mkdtemp()
+    try:
+        for name, column_groups in (("one group", None), ("groups", ("blob",))):
+            stats = dbTable.Stats()
+            table = Table(db_path=db_path, table_name=name, columns=columns, column_groups=column_groups,
+                          observer=stats, mapped_segments=mapped_segments)
+            table.insert_many((f"row-{i}", columns, (i, "x" * cell_size)) for i in range(rows))
+            sample = [f"row-{random.randrange(rows)}" for _ in range(ops)]
+            stats.reset()
+            find_us = _timed(table.find, [(row, "hot") for row in sample])
+            update_us = _timed(lambda row: table.update(data=0, row=row, column="hot"), [(row,) for row in sample])
+            snapshot = stats.snapshot()
+            results.append({
+                "mode": name,
+                "find_us": find_us,
+                "update_us": update_us,
+                "decrypted_bytes": snapshot["find"]["phases"]["decrypt"]["bytes"] / ops,
+                "written_bytes": snapshot["update"]["bytes_written"] / ops,
+            })
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def compression(rows, cell_size):
+    results = []
+    columns = ("name", "city", "notes")
+    words = ("order", "shipped", "pending", "customer", "invoice", "paid", "returned", "warehouse", "the", "of")
+    data = [(f"customer-{i}", random.choice(("Paris", "Berlin", "Madrid", "Rome")),
+             " ".join(random.choice(words) for _ in range(cell_size // 7))) for i in range(rows)]
+    modes = [("none", {})] + [(name, {"compression": name}) for name in dbTable._compressions] + \
+            [("zlib+dict", {"compression": "zlib", "compression_dictionary": True})]
+    db_path = tempfile.mkdtemp()
+    try:
+        for name, options in modes:
+            table = Table(db_path=db_path, table_name=name, columns=columns, codec="pickle", **options)
+            start = time.perf_counter()
+            table.insert_many((f"row-{i}", columns, cells) for i, cells in enumerate(data))
+            insert_s = time.perf_counter() - start
+            table.compact()
+            start = time.perf_counter()
+            assert sum(1 for _ in table.select()) == rows
+            select_s = time.perf_counter() - start
+            # the _D_ files and the dictionaries, the table's other files are not compressed
+            folder = os.path.join(db_path, "_dbTables_", dbTable._hash_(name))
+            size = _disk_usage(os.path.join(folder, "_Database_"))
+            if os.path.isfile(dictionaries := os.path.join(folder, "_MetaData_", "Dictionaries.pickle")):
+                size += os.path.getsize(dictionaries)
+            results.append({"mode": name, "bytes": size, "ratio": size / (results[0]["bytes"] if results else size),
+                            "insert_rows_s": rows / insert_s, "select_rows_s": rows / select_s})
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def bulk(rows):
+    results = []
+    columns = ("column-0", "column-1", "column-2")
+    db_path = tempfile.mkdtemp()
+    try:
+        table = Table(db_path=db_path, table_name="benchmark", columns=columns)
+        table.insert_many((f"row-{i}", columns, (f"data-{i}", i, "x" * 20)) for i in range(rows))
+
+        def row_stringify():
+            with open(os.path.join(db_path, "rows.json"), "w") as w:
+                for row in table.fetchall_rows:
+                    w.write(table.row_stringify(row, indent=None) + "\n")
+
+        def insert():
+            copy = Table(db_path=db_path, table_name="insert", columns=columns)
+            for i in range(rows):
+                copy.insert((f"data-{i}", i, "x" * 20), row=f"row-{i}", columns=columns)
+
+        for name, function in (
+                ("row_stringify", row_stringify),
+                ("export_csv", lambda: table.export_csv(os.path.join(db_path, "table.csv"))),
+                ("export_jsonl", lambda: table.export_jsonl(os.path.join(db_path, "table.jsonl"))),
+                ("insert", insert),
+                ("import_csv", lambda: Table(db_path=db_path, table_name="csv", columns=columns).import_csv(
+                    os.path.join(db_path, "table.csv"))),
+                ("import_jsonl", lambda: Table(db_path=db_path, table_name="jsonl", columns=columns).import_jsonl(
+                    os.path.join(db_path, "table.jsonl")))):
+            start = time.perf_counter()
+            function()
+            results.append({"mode": name, "rows_s": rows / (time.perf_counter() - start)})
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def rekey(rows):
+    results = []
+    columns = ("column-0", "column-1")
+    db_path = tempfile.mkdtemp()
+    try:
+        table = Table(db_path=db_path, table_name="benchmark", columns=columns)
+        table.insert_many((f"row-{i}", columns, (i, "x" * 100)) for i in range(rows))
+        with table.transaction():
+            for i in range(0, rows, 2):
+                table.drop_row(f"row-{i}")
+            for i in range(1, rows, 2):
+                table.update(i * 2, row=f"row-{i}", column="column-0")
+
+        def copy():
+            Table(db_path=db_path, table_name="copy", key="new-key", columns=columns).insert_many(
+                (row, tuple(cells), tuple(cells.values())) for row, cells in table.select())
+
+        for name, function, table_name in (("compact", table.compact, "benchmark"),
+                                           ("rekey", lambda: table.rekey(dbTable.default_key, "new-key"), "benchmark"),
+                                           ("copy", copy, "copy")):
+            database = os.path.join(table.path, dbTable._hash_(table_name), "_Database_")
+            before = _disk_usage(database) if os.path.isdir(database) else 0
+            latencies, done = [], threading.Event()
+
+            def reader():
+                reader_ = Extract(db_path=db_path, table_name="benchmark", decrypt_key=table.default_key)
+                while not done.is_set():
+                    start = time.perf_counter()
+                    try:
+                        reader_.find("row-1", "column-1")
+                    except dbTable.dbTableError:
+                        # rekey replaced the files, the reader has the old key
+                        return
+                    latencies.append(time.perf_counter() - start)
+                    time.sleep(0.001)
+
+            thread = threading.Thread(target=reader)
+            thread.start()
+            start = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - start
+            done.set()
+            thread.join()
+            results.append({"mode": name, "rows_s": rows // 2 / seconds, "bytes_before": before,
+                            "bytes_after": _disk_usage(database), "max_find_ms": max(latencies, default=0) * 1e3})
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+# audit events of the file system calls counted by suite
+_syscalls = ("open", "os.chmod", "os.listdir", "os.mkdir", "os.remove", "os.rename", "os.replace", "os.rmdir",
+             "os.scandir", "os.truncate", "shutil.rmtree")
+_counts = collections.Counter()
+_counting = False
+
+
+def _audit(event, args):
+    if _counting and event in _syscalls:
+        _counts[event] += 1
+
+
+def _disk_usage(path):
+    return sum(os.path.getsize(os.path.join(r, file)) for r, _, f in os.walk(path) for file in f)
+
+
+def _measure(function, arguments, path):
+    # runs function(*args) for every args and returns ops/s, p50 and p99 latency (us),
+    # the bytes under path afterwards and the file system calls per operation
+    global _counting
+    latencies = []
+    _counts.clear()
+    _counting = True
+    try:
+        for args in arguments:
+            start = time.perf_counter_ns()
+            function(*args)
+            latencies.append(time.perf_counter_ns() - start)
+    finally:
+        _counting = False
+    latencies.sort()
+    ops = len(latencies)
+    return {
+        "ops": ops,
+        "ops_s": ops / (sum(latencies) / 1e9),
+        "p50_us": latencies[(ops - 1) // 2] / 1e3,
+        "p99_us": latencies[min(ops - 1, int(ops * 0.99))] / 1e3,
+        "bytes_on_disk": _disk_usage(path),
+        "syscalls": {event: count / ops for event, count in sorted(_counts.items())},
+    }
+
+
+def suite(rows, columns, cell_size, ops, drop_tables=10):
+    sys.addaudithook(_audit)
+    columns_ = tuple(f"column-{i}" for i in range(columns))
+    cell = "x" * cell_size
+    ops = min(ops, rows)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "rows": rows, "columns": columns, "cell_size": cell_size,
+        "segment_size": dbTable.default_segment_size, "codec": dbTable.default_codec,
+        "cipher": dbTable.default_cipher,
+        "operations": {},
+    }
+    operations = results["operations"]
+    db_path = tempfile.mkdtemp()
+    try:
+        generate = Generate(db_path=db_path, table_name="benchmark", columns=columns_)
+        generate.insert_many((f"row-{i}", columns_, (cell,) * columns) for i in range(rows))
+        table = Extract(db_path=db_path, table_name="benchmark")
+        path = os.path.join(table.path, dbTable._hash_("benchmark"))
+        results["bytes_on_disk"] = _disk_usage(path)
+        sample = random.sample(range(rows), ops)
+
+        operations["insert"] = _measure(lambda i: generate.insert(data=(cell,) * columns, row=f"new-{i}",
+                                                                  columns=columns_),
+                                        [(i,) for i in range(ops)], path)
+        operations["find"] = _measure(table.find, [(f"row-{i}", columns_[0]) for i in sample], path)
+        operations["check"] = _measure(table.check, [(f"row-{i}",) for i in sample], path)
+        operations["update"] = _measure(table.update, [(cell, f"row-{i}", columns_[0]) for i in sample], path)
+        operations["remove"] = _measure(table.remove, [(f"row-{i}", columns_[-1]) for i in sample], path)
+        operations["drop_row"] = _measure(table.drop_row, [(f"new-{i}",) for i in range(ops)], path)
+        operations["fetchall_rows"] = _measure(lambda: table.fetchall_rows, [()] * min(ops, 20), path)
+        operations["len"] = _measure(len, [(table,)] * ops, path)
+
+        tables = []
+        for i in range(drop_tables):
+            Generate(db_path=db_path, table_name=f"drop-{i}", columns=columns_).insert_many(
+                (f"row-{r}", columns_, (cell,) * columns) for r in range(100))
+            tables.append((Extract(db_path=db_path, table_name=f"drop-{i}"),))
+        operations["tables"] = _measure(lambda: table.tables, [()] * min(ops, 20), path)
+        operations["drop_table"] = _measure(Extract.drop_table, tables, path)
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="dbTable benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    scaling_ = commands.add_parser("scaling", help="per-operation latency while a table grows")
+    scaling_.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    scaling_.add_argument("--ops", type=int, default=200, help="timed operations per size")
+    scaling_.add_argument("--segment-size", type=int, default=100, help="rows in each _D_ segment file")
+    scaling_.add_argument("--mapped-segments", type=int, default=0, help="Extract's mapped_segments")
+    codecs_ = commands.add_parser("codecs", help="per-row latency of the record codecs")
+    codecs_.add_argument("--columns", type=int, default=50)
+    codecs_.add_argument("--rows", type=int, default=200)
+    ciphers_ = commands.add_parser("ciphers", help="throughput of the ciphers")
+    ciphers_.add_argument("--size", type=int, default=65536, help="payload bytes")
+    ciphers_.add_argument("--rounds", type=int, default=20)
+    readers_ = commands.add_parser("readers", help="find throughput with concurrent reader processes")
+    readers_.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    readers_.add_argument("--rows", type=int, default=10000)
+    readers_.add_argument("--seconds", type=float, default=2.0, help="duration of each run")
+    writes_ = commands.add_parser("writes", help="insert throughput with and without transactions")
+    writes_.add_argument("--rows", type=int, default=2000)
+    writes_.add_argument("--batch", type=int, default=100, help="inserts in each transaction")
+    scan_ = commands.add_parser("scan", help="full-table scan throughput with worker processes")
+    scan_.add_argument("--rows", type=int, default=100000)
+    scan_.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    scan_.add_argument("--cell-size", type=int, default=100, help="characters in each cell")
+    groups_ = commands.add_parser("groups", help="hot column access with and without column groups")
+    groups_.add_argument("--rows", type=int, default=1000)
+    groups_.add_argument("--cell-size", type=int, default=10000, help="characters in the blob column")
+    groups_.add_argument("--ops", type=int, default=200, help="timed operations of each kind")
+    groups_.add_argument("--mapped-segments", type=int, default=None, help="Extract's mapped_segments")
+    compression_ = commands.add_parser("compression", help="size on disk and scan throughput of the compressions")
+    compression_.add_argument("--rows", type=int, default=10000)
+    compression_.add_argument("--cell-size", type=int, default=200, help="characters in the text column")
+    bulk_ = commands.add_parser("bulk", help="export and import throughput against the per-row calls")
+    bulk_.add_argument("--rows", type=int, default=20000)
+    rekey_ = commands.add_parser("rekey", help="compact and rekey throughput against a copy of the rows")
+    rekey_.add_argument("--rows", type=int, default=20000)
+    suite_ = commands.add_parser("suite", help="every public operation, as JSON")
+    suite_.add_argument("--rows", type=int, default=1000)
+    suite_.add_argument("--columns", type=int, default=4)
+    suite_.add_argument("--cell-size", type=int, default=16, help="characters in each cell")
+    suite_.add_argument("--ops", type=int, default=200, help="timed calls of each operation")
+    suite_.add_argument("--drop-tables", type=int, default=10, help="tables of 100 rows dropped by drop_table")
+    suite_.add_argument("--output", help="write the JSON to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.command == "suite":
+        results = json.dumps(suite(args.rows, args.columns, args.cell_size, args.ops, args.drop_tables), indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(results + "\n")
+        else:
+            print(results)
+    elif args.command == "scaling":
+        print(f"{'rows':>10} {'find (us)':>12} {'check (us)':>12} {'update (us)':>12}")
+        for result in scaling(args.sizes, args.ops, args.segment_size, mapped_segments=args.mapped_segments):
+            print(f"{result['rows']:>10} {result['find_us']:>12.1f} {result['check_us']:>12.1f} "
+                  f"{result['update_us']:>12.1f}")
+    elif args.command == "scan":
+        print(f"{'mode':>10} {'rows/s':>10}")
+        for result in scan(args.rows, args.processes, args.cell_size):
+            print(f"{result['mode']:>10} {result['rows_s']:>10.0f}")
+    elif args.command == "groups":
+        print(f"{'mode':>10} {'find (us)':>10} {'update (us)':>12} {'decrypted/find':>15} {'written/update':>15}")
+        for result in groups(args.rows, args.cell_size, args.ops, args.mapped_segments):
+            print(f"{result['mode']:>10} {result['find_us']:>10.1f} {result['update_us']:>12.1f} "
+                  f"{result['decrypted_bytes']:>15.0f} {result['written_bytes']:>15.0f}")
+    elif args.command == "compression":
+        print(f"{'mode':>10} {'bytes':>12} {'ratio':>7} {'insert rows/s':>14} {'select rows/s':>14}")
+        for result in compression(args.rows, args.cell_size):
+            print(f"{result['mode']:>10} {result['bytes']:>12} {result['ratio']:>7.2f} "
+                  f"{result['insert_rows_s']:>14.0f} {result['select_rows_s']:>14.0f}")
+    elif args.command == "bulk":
+        print(f"{'mode':>14} {'rows/s':>10}")
+        for result in bulk(args.rows):
+            print(f"{result['mode']:>14} {result['rows_s']:>10.0f}")
+    elif args.command == "rekey":
+        print(f"{'mode':>10} {'rows/s':>10} {'bytes before':>13} {'bytes after':>12} {'max find (ms)':>14}")
+        for result in rekey(args.rows):
+            print(f"{result['mode']:>10} {result['rows_s']:>10.0f} {result['bytes_before']:>13} "
+                  f"{result['bytes_after']:>12} {result['max_find_ms']:>14.1f}")
+    elif args.command == "readers":
+        print(f"{'processes':>10} {'finds/s':>12} {'finds/s/process':>16}")
+        for result in readers(args.processes, args.rows, args.seconds):
+            print(f"{result['processes']:>10} {result['finds_s']:>12.0f} {result['finds_s_process']:>16.0f}")
+    elif args.command == "writes":
+        print(f"{'mode':>12} {'rows/s':>10}")
+        for result in writes(args.rows, args.batch):
+            print(f"{result['mode']:>12} {result['rows_s']:>10.0f}")
+    elif args.command == "ciphers":
+        print(f"{'cipher':>10} {'size ratio':>11} {'encrypt (MB/s)':>15} {'decrypt (MB/s)':>15}")
+        for result in ciphers(args.size, args.rounds):
+            print(f"{result['cipher']:>10} {result['size_ratio']:>11.2f} {result['encrypt_mb_s']:>15.1f} "
+                  f"{result['decrypt_mb_s']:>15.1f}")
+    else:
+        print(f"{'codec':>10} {'bytes/row':>10} {'dumps (us)':>11} {'loads (us)':>11} "
+              f"{'write (us)':>11} {'read (us)':>11}")
+        for result in codecs(args.columns, args.rows):
+            print(f"{result['codec']:>10} {result['bytes_per_row']:>10.0f} {result['dumps_us']:>11.1f} "
+                  f"{result['loads_us']:>11.1f} {result['write_us']:>11.1f} {result['read_us']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,24 +3,57 @@ __Author__ = "Larbi Sahli"
 __Copyright__ = "Copyright \xa9 2019 Larbi Sahli => https://github.com/larbisahli"
 __License__ = "Public Domain"
 __Version__ = "1.6.0"
-__Table_Rows_Limit__ = 1000
-__all__ = ["Extract", "Generate"]
+__all__ = ["Extract", "Generate", "Table", "Stats", "AsyncExtract", "AsyncGenerate"]
 
+import ast
+import asyncio
+import csv
 import shutil
 import hashlib
 import pickle
+import mmap
 import os
 import stat
+import sys
 import json
+import numbers
+import time
+import threading
+import zlib
 import onetimepad
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import islice
+from contextlib import contextmanager, nullcontext
 import xml.etree.cElementTree as ET
+from functools import partial, reduce as _reduce, wraps
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import fcntl
+except ImportError:  # Windows, the tables are only locked between threads
+    fcntl = None
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
 
 """
 dbTable is a lightweight SQL database file management that can store encrypted data in Tables 
 using rows and columns.
-With dbTable you can store data in files and manage it, each Table can store up to one Thousand Rows
-for speed and efficiency.
-The data inside files is stored using pickle and encrypted using "onetimepad",
+With dbTable you can store data in files and manage it, each Table's rows are split into segment files
+of a fixed size (_D_ files) that are created on demand, so a Table has no rows limit.
+The data inside files is stored using pickle and encrypted with a SHAKE-256 keystream ("onetimepad" for older tables),
 you can use your own key to encrypt and decrypt data for security purposes.
 
 ======= Generate =======
@@ -39,6 +72,19 @@ Generate class => creates Table metadata and inserts data in database.
 > table_name=""            # Table name.
 > encrypt_key="my_key"     # encryption key, default key is default_key variable in the program.
 > columns=""               # Columns (declare all the columns to create the table).
+> segment_size=100         # Rows in each _D_ segment file, only used when the table is created.
+> codec="pickle"           # Rows encoding ("pickle", "repr" or "msgpack" if installed), only used when the table
+                             is created, pickle keeps the data types (datetime, bytes, sets, etc).
+> cipher="shake256"        # Rows encryption ("shake256" or "onetimepad"), only used when the table is created,
+                             shake256 works on raw bytes, onetimepad (tables made by dbTable 1.6) doubles the size.
+> column_groups=None       # Columns stored and encrypted apart, only used when the table is created, e.g.
+                             column_groups=(("blob",), ("column-1", "column-2")), the other columns make one more
+                             group. find, update and remove of a column only read and write its group, so a
+                             small column next to a big one is read without decrypting the big one.
+> compression=None         # Rows compression before encryption ("zlib", "lzma" or "bz2"), only used when the
+                             table is created, for tables of repetitive text.
+> compression_dictionary=False  # zlib only, compact makes a dictionary of each _D_ file's rows (stored encrypted
+                                  in Dictionaries.pickle) and its rows are compressed with it, small rows too.
 
 == inserting data in database ==
 
@@ -57,6 +103,22 @@ data=(data-1, data-2, etc) => columns=(column-1, column-2, etc) see bellow
 -----------------------------------
 row-1 | data-1   |  data-2   | etc
 
+== inserting many rows at once ==
+
+>> conn.insert_many([("row-1", ("column-1", "column-2"), ("data-1", "data-2")),
+                     ("row-2", "column-1", "data-3"), etc])
+
+> rows=[]     # an iterable of (row, columns, data), the columns are checked once and
+              each touched file is written once for the whole batch.
+
+>> conn.import_csv(file="table.csv",            # inserts the rows of a CSV file (a path or a file open in text mode)
+                   batch_size=1000)               made by Extract.export_csv, the header is row, column-1, etc,
+                                                  empty fields are skipped and the data is str.
+>> conn.import_jsonl(file="table.jsonl",        # inserts the rows of a JSON Lines file made by Extract.export_jsonl,
+                     batch_size=1000)             a line {"row": row, "cells": {column: data}} per row.
+                                                  both read the file as they insert it, batch_size rows per
+                                                  insert_many, and return the number of rows.
+
 
 ========= Extract ==========
 
@@ -67,11 +129,24 @@ Extract class =>  find data, check data, update data, fetchall rows, fetchall co
 
 >> conn = Extract(db_path="C:\\Users\\User\\folder", db_name=""my_database"", table_name="my_table",
                decrypt_key=key)
+
+> cache_size=0             # optional, keeps up to cache_size decrypted rows in memory (LRU) for repeated finds,
+                             conn.cache_info gives the hits and misses, conn.cache_clear() empties it.
+> mapped_segments=None     # optional, keeps the offset table ({row: offset} of its last record) of up to
+                             mapped_segments _D_ files in memory (LRU), a row is then read from the mapped file
+                             (mmap) at its offset instead of reading the file from the start, the table of a file
+                             is made when it's first read and follows the writes. None is 0 (no offset tables)
+                             for a table without column groups and dbTable.default_grouped_segments (16) for a
+                             table with them, so a find reads the records of its groups only, 0 turns them off.
                
 >> conn.find(row="row-1", column="column-1")   # a method that can find data cell in row-1 and column-1,
                                                  using conn.find(row="row-1") will give you dictionary of all 
                                                  the columns and the data in row-1.
 
+>> conn.find_many(rows=["row-1", "row-2"],       # a method that finds many rows at once and returns
+                  columns=None)                   {row: {column: data}} of the rows that exist, the rows are grouped
+                                                  by _D_ file so each file is read once.
+
 >> conn.check(row="row-1",column="column-1")    # a method that will return True if data exists False if not,
                                                   you can also use conn.check(row="row-1") to check if a row exist.
                                    
@@ -82,24 +157,185 @@ Extract class =>  find data, check data, update data, fetchall rows, fetchall co
 
 >> conn.drop_row(row="row-1")                   # a method that can remove rows.
 
+>> conn.compact()                               # updates and removed rows are appended to the table's files,
+                                                  compact writes the live rows again one _D_ file at a time,
+                                                  without the old records and the paths of the dropped rows,
+                                                  reads and writes go on until the new files replace the old ones,
+                                                  the records written meanwhile are read and copied again.
+
+>> conn.rekey(old_key=key, new_key=new_key)     # encrypt the table with new_key, the rows are written again as
+                                                  by compact, other instances of the table must be opened again
+                                                  with new_key (Table.rekey opens its Generate again), their
+                                                  writes raise KeyError.
+
+>> conn.migrate(codec="pickle")                 # re-encode all the rows with another codec, tables made by
+                                                  dbTable 1.6 use the slower "repr" codec.
+
 >> conn.fetchall_columns                        # a property that will return a list of all the table's columns.
 
 >> conn.fetchall_rows                           # a property that will return a list of all the table's rows.
 
+>> for row in conn.iter_rows():                 # the table's rows one at a time, in the order of fetchall_rows,
+       ...                                        without making the list (the memory doesn't grow with the table).
+
+>> for row, cells in conn.iter_items(           # (row, {column: data}) of the whole table, one _D_ file in memory
+        columns=("column-1",)):                   at a time, a row is decrypted when it's reached.
+       ...
+
+>> conn.select(columns=("column-1",),           # a method that scans the whole table once and yields
+               where={"column-2": "data-2"},      (row, {column: data}) for the rows that match where,
+               limit=10)                          where can also be a function that takes {column: data}.
+
+>> conn.scan(function=None, where=None,         # a method that scans the whole table with a pool of processes,
+             columns=None, reduce=None,           one _D_ file per worker, and returns function(row, {column: data})
+             processes=None)                      of the rows that match where (or (row, {column: data})) in storage
+                                                  order, reduce(result, result) merges them into one result.
+                                                  function, where and reduce must be functions of a module
+                                                  (picklable), processes defaults to the number of CPUs.
+
+>> conn.create_index(column="column-1")         # a method that indexes the values of a column (also on Generate),
+                                                  the index keeps hashed values and follows every change,
+                                                  equal numbers (1, 1.0, True), sets and dicts match whatever
+                                                  their order, the values of other types match by repr.
+
+>> conn.find_by(column="column-1",              # a method that returns {row: {column: data}} of the rows that have
+                value="data-1")                   data-1 in column-1, using the column's index.
+
 >> conn.row_stringify(row="row-1", indent=2,    # using json.dumps on a dictionary of all columns and cells in a row.
                       sort_keys=False):  
 
+>> conn.export_csv(file="table.csv",            # writes the whole table to a CSV file (a path or a file open in
+                   columns=None)                  text mode) in storage order, one _D_ file in memory at a time,
+                                                  a header row, column-1, etc and a line per row (a missing cell
+                                                  is an empty field), returns the number of rows.
+>> conn.export_jsonl(file="table.jsonl",        # the same as JSON Lines, a line {"row": row, "cells": {column: data}}
+                     columns=None)                per row, data that isn't JSON is written as str.
+
 >> len(conn)                                    # returns how many rows inside a table.
 
 >> conn.tables                                  # a property that will return a list of all tables that were created
                                                   in database.
+                                                  the names are kept in the database's catalog (_Catalog_.pickle),
+                                                  written when a table is made or dropped.
+
+>> conn.catalog                                 # a property that returns {table: {"folder", "columns", "rows"}}
+                                                  of all the tables in database.
+
+>> conn.rebuild_catalog()                       # makes the catalog again from the tables' folders, if they were
+                                                  copied or removed by hand.
 
 >> conn.drop_table                              # a property that will remove the whole table from database.
 
+========= Table ==========
+
+from dbTable import Table
+
+Table class => Generate and Extract in one handle, insert, insert_many, import_csv, import_jsonl and all of
+Extract's methods.
+
+>> table = Table(db_path="C:\\Users\\User\\folder", db_name="my_database", table_name="my_table", key=key,
+                 columns=("column-1", "column-2", etc))
+
+> columns=""   # only to make the table, without it the table must exist.
+> cache_size=0 # and mapped_segments, segment_size, codec, cipher, column_groups, compression,
+                 compression_dictionary, same as Extract and Generate.
+
+>> with Table(table_name="my_table", key=key) as table:   # a handle kept open for the life of the program,
+       table.find(row="row-1")                             the table's state is read once and the files written
+                                                           by the transactions are kept open, close() (or the end
+                                                           of the with block) writes the WAL to them and syncs.
+
+> dbTable.read_only_files = False   # the files are chmod read-only between writes by default,
+                                      turning it off saves the chmod calls.
+
+== threads and processes ==
+
+A table is locked on every call, reads (find, check, select, etc) share the lock and run in parallel,
+writes (insert, update, remove, drop_row, compact, etc) wait for it alone, between the threads of a process
+and between processes (an fcntl lock on the table's Lock file, only the threads are locked on Windows).
+Table, Extract and Generate instances can be shared by many threads.
+
+== transactions ==
+
+>> with table.transaction():                   # (also on Extract and Generate) the writes in the block are all
+       table.insert(data=..., row="row-1")        applied or none of them is, an exception rolls them back.
+       table.update(data=..., row="row-2", column="column-1")
+
+> sync=True    # the transaction is logged in _MetaData_/WAL.pickle with one fsync on commit, sync=False skips it.
+
+Each insert, update, remove and drop_row outside a block is a transaction of its own (without fsync),
+grouping many writes in one transaction writes each file once and syncs once.
+The log is replayed when a table is opened after a crash, compact, rekey, migrate, create_index and
+drop_table can't run inside a transaction.
+
+== statistics ==
+
+>> from dbTable import Stats
+>> stats = Stats(callback=None)
+>> table = Table(table_name="my_table",         # times every operation of the table (observer= also on Extract
+                 key=key, observer=stats)         and Generate), one Stats can observe many tables.
+
+>> stats.snapshot()                             # {operation: {calls, errors, seconds, files_opened, bytes_read,
+                                                  bytes_written, phases}} of find, insert, update, select, etc.
+                                                  phases break the time down => lock, index, read, decrypt,
+                                                  decompress, decode, encode, compress, encrypt, write,
+                                                  commit (the WAL writes the files) and
+                                                  switch (migrate), with {calls, seconds, bytes} each.
+>> stats.reset()
+
+> callback=function   # called with the record of every operation when it ends, to send them to a metrics
+                        system, the record is {operation, seconds, error, files_opened, bytes_read,
+                        bytes_written, phases}.
+
+Without an observer nothing is timed.
+
+== asyncio ==
+
+from dbTable import AsyncExtract, AsyncGenerate
+
+AsyncExtract and AsyncGenerate take the arguments of Extract and Generate, the calls run in a pool of
+threads so they don't block the event loop, reads run in parallel and the writes wait for each other.
+
+>> conn = AsyncGenerate(table_name="my_table", columns=("column-1", "column-2"))
+>> await conn.insert(data=("data-1", "data-2"), row="row-1", columns=("column-1", "column-2"))
+>> await conn.insert_many(rows)                        # also import_csv and import_jsonl
+
+>> conn = AsyncExtract(table_name="my_table")
+>> await conn.find(row="row-1", column="column-1")   # also find_many, check, find_by, row_stringify, update,
+                                                       remove, drop_row, create_index, compact, rekey,
+                                                       export_csv, export_jsonl, fetchall_rows() and count()
+                                                       (len of the table).
+>> async for row, cells in conn.select(where={"column-1": "data-1"}):   # also iter_rows() and iter_items()
+       ...
+
+> executor=None                  # optional, a concurrent.futures executor for the calls.
+> dbTable.default_async_workers  # threads of the default executor (8), shared by all the instances.
+
+A transaction runs in one thread, use Table.transaction in a function given to loop.run_in_executor.
+
 """
 
 current_directory = os.path.dirname(os.path.realpath(__file__))
 default_key = "435e6a8cad566114c8641af7871bf20ddf8216881f6d1b7b1681c6eb9ffd7b8a"
+default_segment_size = 100  # rows in each _D_ file
+default_codec = "pickle"  # rows encoding of new tables
+default_cipher = "shake256"  # rows encryption of new tables
+default_wal_size = 4 * 1024 * 1024  # bytes of WAL before a checkpoint
+read_only_files = True  # the table's files are made read-only (chmod) between writes
+default_async_workers = 8  # threads of the executor shared by AsyncExtract and AsyncGenerate
+default_grouped_segments = 16  # mapped_segments of an Extract of a table with column groups
+_missing = object()
+
+
+def _writable(file):
+    # with read_only_files off, the files of older tables are made writable once
+    if read_only_files or not os.access(file, os.W_OK):
+        os.chmod(file, stat.S_IWRITE)
+
+
+def _read_only(file):
+    if read_only_files:
+        os.chmod(file, stat.S_IREAD)
 
 
 def _hash_(dir_):
@@ -114,6 +350,144 @@ def _decrypt(encrypted_data, key_):
     return onetimepad.decrypt(encrypted_data, key_)
 
 
+class _Codec:
+    """ Record codec, turns a row {row: {column: data}} into bytes and back """
+
+    def __init__(self, name, dumps, loads, encoding='latin-1'):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        # the onetimepad cipher works on text, the payload's bytes are mapped to text with this encoding
+        self.encoding = encoding
+
+
+def _repr_dumps(data):
+    return str(data).encode('utf-8')
+
+
+def _repr_loads(payload):
+    return ast.literal_eval(payload.decode('utf-8'))
+
+
+_codecs = {
+    # str(dict) of the tables made by dbTable 1.6 and older
+    "repr": _Codec("repr", _repr_dumps, _repr_loads, encoding='utf-8'),
+    "pickle": _Codec("pickle", partial(pickle.dumps, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+}
+if msgpack is not None:
+    _codecs["msgpack"] = _Codec("msgpack", msgpack.packb, partial(msgpack.unpackb, strict_map_key=False))
+
+
+def _codec(name):
+    if name not in _codecs:
+        raise dbTableError(f"Unknown codec {name}, the available codecs: {tuple(_codecs)}")
+    return _codecs[name]
+
+
+class _Cipher:
+    """
+    Cipher backend, encrypts the rows (bytes) with the table's key.
+    A deterministic cipher gives the same output for the same row name, so rows.pickle can
+    store the encrypted names as they are.
+    """
+
+    def __init__(self, name, encrypt, decrypt, deterministic=False):
+        self.name = name
+        self.encrypt = encrypt
+        self.decrypt = decrypt
+        self.deterministic = deterministic
+
+
+def _onetimepad_encrypt(payload, key_, encoding):
+    return _encrypt(payload.decode(encoding), key_)
+
+
+def _onetimepad_decrypt(encrypted_data, key_, encoding):
+    return _decrypt(encrypted_data, key_).encode(encoding)
+
+
+def _keystream_xor(data, key_, nonce):
+    # XOR the whole buffer with a SHAKE-256 keystream at once, as big ints
+    stream = hashlib.shake_256(key_.encode() + nonce).digest(len(data))
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(stream, 'little')).to_bytes(len(data), 'little')
+
+
+def _shake256_encrypt(payload, key_, encoding=None):
+    nonce = os.urandom(12)
+    return nonce + _keystream_xor(payload, key_, nonce)
+
+
+def _shake256_decrypt(encrypted_data, key_, encoding=None):
+    return _keystream_xor(encrypted_data[12:], key_, encrypted_data[:12])
+
+
+_ciphers = {
+    # hex text of the tables made by dbTable 1.6 and older
+    "onetimepad": _Cipher("onetimepad", _onetimepad_encrypt, _onetimepad_decrypt, deterministic=True),
+    # raw bytes, a random nonce per record
+    "shake256": _Cipher("shake256", _shake256_encrypt, _shake256_decrypt),
+}
+
+
+def _cipher(name):
+    if name not in _ciphers:
+        raise dbTableError(f"Unknown cipher {name}, the available ciphers: {tuple(_ciphers)}")
+    return _ciphers[name]
+
+
+class _Compression:
+    """
+    Compression of the record payloads, applied before the cipher so it still finds the repetitions.
+    A compression with dictionary=True can use a preset dictionary (zlib), its compressed data
+    names the dictionary it needs.
+    """
+
+    def __init__(self, name, compress, decompress, dictionary=False):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+        self.dictionary = dictionary
+
+
+def _zlib_compress(payload, dictionary=None):
+    if dictionary is None:
+        return zlib.compress(payload)
+    compressor = zlib.compressobj(zdict=dictionary)
+    return compressor.compress(payload) + compressor.flush()
+
+
+def _zlib_decompress(data, dictionaries=None):
+    if data[1] & 0x20:
+        # FDICT, the header is followed by the Adler-32 of the dictionary
+        decompressor = zlib.decompressobj(zdict=dictionaries[int.from_bytes(data[2:6], 'big')])
+        return decompressor.decompress(data) + decompressor.flush()
+    return zlib.decompress(data)
+
+
+def _without_dictionary(function):
+    # lzma and bz2 take no preset dictionary
+    return lambda data, dictionary=None: function(data)
+
+
+_compressions = {
+    "zlib": _Compression("zlib", _zlib_compress, _zlib_decompress, dictionary=True),
+}
+if lzma is not None:
+    _compressions["lzma"] = _Compression("lzma", _without_dictionary(lzma.compress),
+                                         _without_dictionary(lzma.decompress))
+if bz2 is not None:
+    _compressions["bz2"] = _Compression("bz2", _without_dictionary(bz2.compress), _without_dictionary(bz2.decompress))
+
+
+def _compression(name):
+    # None is no compression, the default and the tables made before it
+    if name is None:
+        return None
+    if name not in _compressions:
+        raise dbTableError(f"Unknown compression {name}, the available compressions: {tuple(_compressions)}")
+    return _compressions[name]
+
+
 class dbTableError(Exception):
     pass
 
@@ -137,31 +511,160 @@ class _XML:
     # Storing table's state in XML
     def __init__(self, xml_ts):
         self.xml_ts = xml_ts
+        self.__tree = None
+        self.__stamp = None
+        self.__access = None
+
+    def __parse(self):
+        # parsed once, and again only when the file changed
+        st = os.stat(self.xml_ts)
+        if (stamp := (st.st_ino, st.st_size, st.st_mtime_ns)) != self.__stamp:
+            self.__tree, self.__stamp, self.__access = ET.parse(self.xml_ts), stamp, None
+        return self.__tree
+
+    def get(self, tag, default=None):
+        # optional table state, tables made by older versions fall back to default
+        element = self.__parse().find(f"Table/{tag}")
+        return default if element is None else element.text
+
+    def set(self, tag, text):
+        tree = ET.parse(self.xml_ts)
+        if (element := tree.find(f"Table/{tag}")) is None:
+            element = ET.SubElement(tree.find("Table"), tag)
+        element.text = f"{text}"
+        _writable(self.xml_ts)
+        tree.write(self.xml_ts)
+        _read_only(self.xml_ts)
+        self.__stamp = None
 
     def access(self, *, path=False):
         if not path:
-            col = (tree := ET.parse(self.xml_ts)).find("Table/columns").text
-            hashed_key = tree.find("Table/hashed_key").text
-            return eval(col), hashed_key
+            tree = self.__parse()
+            if self.__access is None:
+                col = tree.find("Table/columns").text
+                hashed_key = tree.find("Table/hashed_key").text
+                self.__access = ast.literal_eval(col), hashed_key
+            return self.__access
         else:
-            return ET.parse(self.xml_ts).find("Table/Name").text
+            return self.__parse().find("Table/Name").text
+
+
+def _table_insert(xml, **arguments):
+    """
+    The _Insert of a table with the options of its T_state.xml (segment size, codec, cipher, column groups
+    and compression), tables made by older versions get their defaults. arguments are the other ones of _Insert.
+    """
+    return _Insert(segment_size=xml.get("segment_size", default_segment_size), codec=xml.get("codec", "repr"),
+                   cipher=xml.get("cipher", "onetimepad"),
+                   column_groups=ast.literal_eval(xml.get("column_groups", "()")),
+                   compression=xml.get("compression"),
+                   compression_dictionary=xml.get("compression_dictionary") == "True", **arguments)
+
+
+def _decode(encrypted_data, key_, codec, cipher, compression=None, dictionaries=None):
+    """
+    Decrypt and decode a row, rows written with another codec (by an interrupted migrate
+    or an instance opened before it) are tried with every codec
+    """
+    for codec_ in (codec, *_codecs.values()):
+        try:
+            if compression is None:
+                return codec_.loads(cipher.decrypt(encrypted_data, key_, codec_.encoding))
+            return codec_.loads(compression.decompress(cipher.decrypt(encrypted_data, key_, 'latin-1'),
+                                                       dictionaries))
+        except Exception:
+            continue
+    raise dbTableError(f"Can't decode a row with the codec {codec.name}.")
 
 
 def _is_backup(*, file):
-    """ Check which of the files is available, file or its backup """
-    with open(file, 'rb') as r:
+    """ Check which of the files is available, file or its backup (an empty file means its backup) """
+    return os.stat(file).st_size == 0
+
+
+def _records(file):
+    """
+    Yield the pickled records of a file (a path or a file open in 'rb' mode, read from its position),
+    a torn record at the end (interrupted append) ends the file
+    """
+    if isinstance(file, (str, bytes, os.PathLike)):
+        with open(file, 'rb') as r:
+            yield from _records(r)
+        return
+    while True:
         try:
-            pickle.load(r)
-            return False
-        except EOFError:
-            return True
+            yield pickle.load(file)
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            return
+
+
+@contextmanager
+def _text_file(file, mode):
+    # a path is opened (and closed), a file open in text mode is used as it is
+    if isinstance(file, (str, bytes, os.PathLike)):
+        with open(file, mode, newline='', encoding='utf-8') as f:
+            yield f
+    else:
+        yield file
+
+
+def _dumps(records):
+    return b"".join(pickle.dumps(record) for record in records)
+
+
+def _write(file, data, mode="ab"):
+    """ Append (or with mode="wb" write) bytes to a file, made if it doesn't exist """
+    if os.path.isfile(file):
+        _writable(file)
+    with open(file, mode) as a:
+        a.write(data)
+    _read_only(file)
+
+
+def _append(*, file, records):
+    """ Append records to a file, an O(1) write per record """
+    _write(file, _dumps(records))
+
+
+def _fsync(file):
+    _writable(file)
+    with open(file, 'ab') as a:
+        os.fsync(a.fileno())
+    _read_only(file)
+
+
+def _truncate(file, size):
+    """ Cut a file back to size, the new file replaces the old one so the instances that read it reload it """
+    with open(file, 'rb') as r, open(temp := f"{file}.tmp", 'wb') as w:
+        w.write(r.read(size))
+    _writable(file)
+    os.replace(temp, file)
+    _read_only(file)
+
 
+def _live(records):
+    """
+    Replay append-only records into an ordered dict, the last record of a key wins
+    and a None value (tombstone) drops the key.
+    bare records (rows.pickle) are the key itself, their tombstone is {key: None}.
+    """
+    live = dict()
+    for record in records:
+        for key, value in (record.items() if isinstance(record, dict) else ((record, record),)):
+            live.pop(key, None)
+            if value is not None:
+                live.__setitem__(key, value)
+    return live
 
-def _F_B_switch(*, file, backup, change=None):
+
+def _F_B_switch(*, file, backup, bare=False, convert=None):
     """
-    Instead of reading the whole file into the memory and write it again
-    to make a small change or an update, it is a better practice to toggle between
-    a file and its backup if we use pickle.
+    Compaction, the files are append-only (updates and tombstones are appended),
+    so the live records are written to the other side of the file/backup pair and
+    the old side is cleared.
+    The live records go to a temporary file that replaces the other side at once,
+    so a crash at any point leaves one complete side available.
+    convert (optional) is applied to every live value on the way.
     """
 
     fb_state = _is_backup(file=file)
@@ -169,49 +672,1656 @@ def _F_B_switch(*, file, backup, change=None):
 
     read = file if not fb_state else backup
     write = backup if not fb_state else file
-    with open(read, 'rb') as r:
-        os.chmod(write, stat.S_IWRITE)
-        with open(write, 'ab') as a:
-            try:
-                while dictionary := pickle.load(r):
-                    if dictionary.__contains__(change):
-                        continue
-                    pickle.dump(dictionary, a)
-            except EOFError:
-                pass
-            os.chmod(write, stat.S_IREAD)
-    os.chmod(read, stat.S_IWRITE)
+    live = _live(_records(read))
+
+    with open(temp := f"{write}.tmp", 'wb') as w:
+        for key, value in live.items():
+            pickle.dump(key if bare else {key: value if convert is None else convert(value)}, w)
+        w.flush()
+        os.fsync(w.fileno())
+    _writable(write)
+    os.replace(temp, write)
+    _read_only(write)
+    _writable(read)
     # clear the file
     with open(read, 'wb'):
-        os.chmod(read, stat.S_IREAD)
+        _read_only(read)
+    # the available side after the switch
+    return write if live else backup
+
+
+class _Sides:
+    """
+    Per-instance cache of the available side of each file/backup pair, so the hot paths
+    don't probe the files with _is_backup on every read and write.
+    Sides only flip on _F_B_switch, which updates the cache of the instance that made it,
+    the other instances clear their cache when the row index shows the table was compacted.
+    made holds the _D_ files known to exist, compact may remove some of them.
+    """
+
+    def __init__(self, wal=None, observer=None):
+        self.__sides = dict()
+        self.made = set()
+        self.wal = wal
+        self.observer = observer
+
+    def __side(self, file, backup):
+        if (side := self.__sides.get(file)) is None:
+            side = self.__sides[file] = backup if _is_backup(file=file) else file
+        return side
+
+    def get(self, *, file, backup):
+        # the side to read, with the writes of the current transaction
+        side = self.__side(file, backup)
+        if self.wal is not None:
+            self.wal.flush(side)
+        return side
+
+    def append(self, *, file, backup, records):
+        side = self.__side(file, backup)
+        data = _dumps(records)
+        with nullcontext() if self.observer is None else self.observer.phase("write", len(data)):
+            if self.wal is None or not self.wal.write(side, data):
+                _write(side, data)
+
+    def switch(self, *, file, backup, bare=False, convert=None):
+        with nullcontext() if self.observer is None else self.observer.phase(
+                "switch", os.path.getsize(file) + os.path.getsize(backup)):
+            self.__sides[file] = _F_B_switch(file=file, backup=backup, bare=bare, convert=convert)
+
+    def clear(self):
+        self.__sides.clear()
+        self.made.clear()
+
+
+class _TableLock:
+    """
+    Readers-writer lock of a table, shared for reads and exclusive for writes.
+    The threads of a process are ordered with a condition and the processes with an advisory
+    fcntl.flock on _MetaData_/Lock.
+    A thread that holds the lock exclusively can take it again (shared or exclusive).
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.__fd = None
+        self.__pid = os.getpid()
+        self.__cond = threading.Condition()
+        self.__readers = 0
+        self.__writer = None
+        self.__waiting = 0
+        self.__local = threading.local()
+
+    def __flock(self, operation):
+        # operation => "LOCK_SH", "LOCK_EX" or "LOCK_UN"
+        if fcntl is None or (operation == "LOCK_UN" and self.__fd is None):
+            return
+        if self.__pid != os.getpid():
+            # a forked child shares the parent's open file, it needs its own to be locked apart
+            self.__fd, self.__pid = None, os.getpid()
+        if self.__fd is None:
+            self.__fd = os.open(self.file, os.O_RDONLY | os.O_CREAT, stat.S_IREAD)
+        fcntl.flock(self.__fd, getattr(fcntl, operation))
+
+    @contextmanager
+    def shared(self, observer=None):
+        # observer (optional) records the wait as the "lock" phase
+        if self.__writer == threading.get_ident() or getattr(self.__local, "depth", 0):
+            # nested in a write or a read of the same thread
+            self.__local.depth = getattr(self.__local, "depth", 0) + 1
+            try:
+                yield
+            finally:
+                self.__local.depth -= 1
+            return
+
+        start = time.perf_counter()
+        with self.__cond:
+            # waiting writers go first, a stream of readers can't starve them
+            while self.__writer is not None or self.__waiting:
+                self.__cond.wait()
+            if self.__readers == 0:
+                self.__flock("LOCK_SH")
+            self.__readers += 1
+        if observer is not None:
+            observer.record("lock", time.perf_counter() - start)
+        self.__local.depth = 1
+        try:
+            yield
+        finally:
+            self.__local.depth = 0
+            with self.__cond:
+                self.__readers -= 1
+                if self.__readers == 0:
+                    self.__flock("LOCK_UN")
+                    self.__cond.notify_all()
+
+    @contextmanager
+    def exclusive(self, observer=None):
+        if (me := threading.get_ident()) == self.__writer:
+            yield
+            return
+        if getattr(self.__local, "depth", 0):
+            raise dbTableError("A table can't be changed while the same thread is reading it.")
+
+        start = time.perf_counter()
+        with self.__cond:
+            self.__waiting += 1
+            while self.__writer is not None or self.__readers:
+                self.__cond.wait()
+            self.__waiting -= 1
+            self.__writer = me
+        try:
+            self.__flock("LOCK_EX")
+            if observer is not None:
+                observer.record("lock", time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                self.__flock("LOCK_UN")
+        finally:
+            with self.__cond:
+                self.__writer = None
+                self.__cond.notify_all()
+
+    def close(self):
+        # closing the file releases its flock
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+
+class _Handles:
+    """
+    Files kept open for writing by the WAL, at most maxsize of them (the least recently used is closed).
+    A handle is checked against the file's inode before each write, a file replaced by compact
+    or cut back by a rollback is opened again. The file is read-only again as soon as it's open.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.__handles = OrderedDict()
+
+    def __get(self, file, mode):
+        try:
+            inode = os.stat(file).st_ino
+        except FileNotFoundError:
+            inode = None
+        if (entry := self.__handles.get(file)) is not None:
+            if entry[0] == inode and entry[1] == mode:
+                self.__handles.move_to_end(file)
+                return entry[2]
+            entry[2].close()
+
+        if inode is None:
+            open(file, 'wb').close()
+        else:
+            _writable(file)
+        handle = open(file, mode)
+        _read_only(file)
+        self.__handles[file] = (os.fstat(handle.fileno()).st_ino, mode, handle)
+        while len(self.__handles) > self.maxsize:
+            self.__handles.popitem(last=False)[1][2].close()
+        return handle
+
+    def append(self, file, data):
+        (handle := self.__get(file, 'ab')).write(data)
+        handle.flush()
+
+    def rewrite(self, file, data):
+        (handle := self.__get(file, 'r+b')).seek(0)
+        handle.write(data)
+        handle.truncate()
+        handle.flush()
+
+    def sync(self, file):
+        os.fsync(self.__get(file, 'ab').fileno())
+
+    def close(self):
+        for _, _, handle in self.__handles.values():
+            handle.close()
+        self.__handles.clear()
+
+
+class _Pending:
+    """ A file written in a transaction """
+
+    def __init__(self, size, rewrite):
+        self.size = size  # of the file before the transaction
+        self.rewrite = rewrite  # the whole file is written again (Track.pickle)
+        self.written = bytearray()  # written to the file already
+        self.buffered = bytearray()
+        self.logged = False  # size is in the WAL, the file can be cut back to it
+
+
+class _WAL:
+    """
+    Write-ahead log of a table's transactions, _MetaData_/WAL.pickle.
+    In a transaction the writes are buffered by file, a file that is read before the commit is
+    written early and its size is logged first so it can be cut back.
+    The commit logs one record with all the written bytes (one fsync with sync=True),
+    then writes the files and logs "done", so a crash at any point leaves the transaction
+    in the log to be written again or undone when the table is opened.
+    A checkpoint syncs the files and empties the log once it's bigger than default_wal_size.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.root = os.path.dirname(os.path.dirname(file))
+        # changes when a transaction is rolled back, the journals drop what they applied in memory
+        self.generation = 0
+        # changes when the files may have changed under this process, the cached Track is read again
+        self.version = 0
+        self.__owner = None
+        self.__sync = False
+        self.__files = dict()
+        self.__cache = dict()
+        self.__handles = _Handles()
+        self.__logging = False
+        # (token, offset) of the log read so far, every new log starts with a new token
+        self.__token = None
+        self.__seen = 0
+
+    def __path(self, path):
+        return os.path.join(self.root, path)
+
+    def __header(self):
+        # every new log starts with a new token, so the other processes see it was emptied
+        self.__token = os.urandom(8).hex()
+        return pickle.dumps(("wal", self.__token))
+
+    def __log(self, entry, sync=False):
+        if not self.__logging:
+            if not os.path.isfile(self.file) or os.path.getsize(self.file) == 0:
+                self.__handles.append(self.file, self.__header())
+            self.__logging = True
+        self.__handles.append(self.file, pickle.dumps(entry))
+        if sync:
+            self.__handles.sync(self.file)
+
+    def write(self, file, data, rewrite=False):
+        # buffers data in the current transaction of the thread, False when there is none
+        if self.__owner != threading.get_ident():
+            return False
+        if (pending := self.__files.get(file)) is None:
+            pending = self.__files[file] = _Pending(0 if rewrite else os.path.getsize(file), rewrite)
+        if rewrite:
+            pending.buffered = bytearray(data)
+        else:
+            pending.buffered += data
+        return True
+
+    def read(self, file):
+        # the content of a rewritten file in the transaction, buffered or remembered from an earlier one
+        if self.__owner != threading.get_ident():
+            return None
+        if (pending := self.__files.get(file)) is not None and pending.rewrite:
+            return bytes(pending.buffered)
+        if (cached := self.__cache.get(file)) is not None and cached[0] == self.version:
+            return cached[1]
+        return None
+
+    def remember(self, file, data):
+        if self.__owner == threading.get_ident():
+            self.__cache[file] = (self.version, data)
+
+    def flush(self, file):
+        # write the buffered appends of a file before it's read
+        if self.__owner != threading.get_ident():
+            return
+        if (pending := self.__files.get(file)) is None or pending.rewrite or not pending.buffered:
+            return
+        if not pending.logged:
+            self.__log(("undo", os.path.relpath(file, self.root), pending.size))
+            pending.logged = True
+        self.__handles.append(file, pending.buffered)
+        pending.written += pending.buffered
+        pending.buffered = bytearray()
+
+    @contextmanager
+    def transaction(self, sync=False, observer=None):
+        if self.__owner == threading.get_ident():
+            # joins the transaction of the caller
+            self.__sync = self.__sync or sync
+            yield
+            return
+
+        self.__catch_up()
+        self.rebuilt()
+        self.__owner, self.__sync = threading.get_ident(), sync
+        try:
+            yield
+        except BaseException:
+            self.__rollback()
+            raise
+        self.__commit(observer)
+
+    def __commit(self, observer=None):
+        try:
+            if self.__files:
+                with nullcontext() if observer is None else observer.phase(
+                        "commit", sum(len(pending.written) + len(pending.buffered)
+                                      for pending in self.__files.values())):
+                    self.__log(("commit", [(os.path.relpath(file, self.root), pending.size,
+                                            bytes(pending.written + pending.buffered), pending.rewrite)
+                                           for file, pending in self.__files.items()]), sync=self.__sync)
+                    for file, pending in self.__files.items():
+                        if pending.rewrite:
+                            self.__handles.rewrite(file, pending.buffered)
+                            self.__cache[file] = (self.version, bytes(pending.buffered))
+                        elif pending.buffered:
+                            self.__handles.append(file, pending.buffered)
+                    self.__log(("done",))
+        finally:
+            self.__end()
+        if self.__seen > default_wal_size:
+            self.checkpoint()
+
+    def __rollback(self):
+        try:
+            if logged := [(file, pending.size) for file, pending in self.__files.items() if pending.logged]:
+                self.__handles.close()
+                for file, size in logged:
+                    _truncate(file, size)
+                self.__log(("abort",))
+        finally:
+            self.generation += 1
+            self.version += 1
+            self.__end()
+
+    def __end(self):
+        self.__seen = os.path.getsize(self.file) if self.__logging else self.__seen
+        self.__logging = False
+        self.__files.clear()
+        self.__owner = None
+
+    def dirty(self):
+        # anything logged after the header
+        return os.path.isfile(self.file) and os.path.getsize(self.file) > _wal_header
+
+    def __entries(self, start=0):
+        # (offset after the entry, entry) of the log, a torn entry at the end is cut off
+        with open(self.file, 'rb') as r:
+            r.seek(start)
+            while True:
+                try:
+                    entry = pickle.load(r)
+                except Exception:
+                    break
+                yield r.tell(), entry
+            end, size = r.tell(), os.fstat(r.fileno()).st_size
+        if end < size:
+            self.__handles.close()
+            _truncate(self.file, end)
+
+    def __redo(self, changes):
+        self.version += 1
+        for path, size, data, rewrite in changes:
+            file = self.__path(path)
+            if rewrite or not os.path.isfile(file):
+                _write(file, data, "wb")
+                continue
+            _writable(file)
+            with open(file, 'r+b') as w:
+                w.truncate(size)
+                w.seek(size)
+                w.write(data)
+            _read_only(file)
+
+    def __replay(self, start=0, everything=False):
+        # finish the last transaction of the log, everything=True also writes all the committed ones again
+        commit, undo = None, []
+        for self.__seen, entry in self.__entries(start):
+            if entry[0] == "undo":
+                undo.append(entry[1:])
+            elif entry[0] == "commit":
+                commit, undo = entry[1], []
+                if everything:
+                    self.__redo(commit)
+            elif entry[0] == "wal":
+                self.__token = entry[1]
+            else:  # "done" or "abort"
+                commit, undo = None, []
+
+        if commit is not None and not everything:
+            self.__redo(commit)
+        if undo:
+            self.__handles.close()
+            for path, size in reversed(undo):
+                _truncate(self.__path(path), size)
+            self.generation += 1
+
+    def __catch_up(self):
+        # another process may have died in a transaction, what it logged since the last look is finished
+        if not os.path.isfile(self.file):
+            self.version += 1 if self.__token is not None else 0
+            self.__token, self.__seen = None, 0
+            return
+        try:
+            with open(self.file, 'rb') as r:
+                token = pickle.load(r)[1]
+        except Exception:
+            token = None
+        if token is None or token != self.__token:
+            # emptied by a checkpoint since the last look
+            self.version += 1
+            self.__replay()
+        elif os.path.getsize(self.file) != self.__seen:
+            self.version += 1
+            self.__replay(self.__seen)
+
+    def recover(self):
+        # on open, under the table's exclusive lock
+        if self.__owner is not None or not self.dirty():
+            return
+        if self.__token is not None:
+            # this process wrote or followed the log, its files hold the commits, only a transaction
+            # cut since by another process is finished
+            self.__catch_up()
+            return
+        # the files are synced on checkpoint only, a crash of the system may have lost the writes
+        # of the logged commits, they are all written again
+        self.__replay(everything=True)
+        self.checkpoint()
+
+    def rebuilt(self):
+        # under the table's exclusive lock, a rebuild committed by an instance that died before moving
+        # its files is finished before any write, a new log tells the other instances to read them again
+        if _finish_rebuild(self.root):
+            self.renew()
+
+    def outside(self):
+        # the methods that rewrite the table's files wait for the end of the transactions
+        if self.__owner == threading.get_ident():
+            raise dbTableError("compact, rekey, migrate, create_index and drop_table can't run inside a transaction.")
+
+    def checkpoint(self):
+        # sync the files of the logged transactions, then empty the log
+        self.outside()
+        # compact and the rollbacks replace files, they can't be open (Windows)
+        self.__handles.close()
+        if not self.dirty():
+            return
+        for path in {change[0] for _, entry in self.__entries() if entry[0] == "commit" for change in entry[1]}:
+            if os.path.isfile(file := self.__path(path)):
+                _fsync(file)
+        self.__empty()
+
+    def __empty(self):
+        _writable(self.file)
+        with open(self.file, 'wb') as w:
+            w.write(self.__header())
+            w.flush()
+            os.fsync(w.fileno())
+        _read_only(self.file)
+        self.__seen = _wal_header
+
+    def renew(self):
+        # the table's files were replaced (Extract.compact, rekey), a new log tells the other processes
+        # to read them again instead of their cached Track
+        self.checkpoint()
+        self.__empty()
+        self.version += 1
+
+    def close(self):
+        self.checkpoint()
+        self.version += 1
+
+
+_wal_header = len(pickle.dumps(("wal", os.urandom(8).hex())))
+_tables = dict()
+_tables_mutex = threading.RLock()
+
+
+def _per_table(cls, file):
+    # one lock and one WAL per table and process, shared by all the Extract and Generate instances of the table
+    with _tables_mutex:
+        if (table_object := _tables.get(key := (cls, os.path.realpath(file)))) is None:
+            table_object = _tables[key] = cls(file)
+        return table_object
+
+
+class _Observed(threading.local):
+    operation = None  # record of the operation the thread runs, for Stats
+
+
+_observed = _Observed()
+_audit_mutex = threading.Lock()
+_audited = False
+
+
+def _count_opens(event, args):
+    if event == "open" and (record := _observed.operation) is not None:
+        record["files_opened"] += 1
+
+
+class Stats:
+    """
+    Observer of a table's operations, given with observer=Stats() to Extract, Generate or Table.
+    Every operation (find, insert, update, select, transaction, etc) is timed and broken down by phase:
+    lock (waiting for the table's lock), index (row and column index lookups), read (_D_ files),
+    decrypt, decompress, decode, encode, compress, encrypt, write (appends, buffered in a transaction), commit
+    (the WAL writes the files) and switch (migrate), with the bytes of each phase and the files opened.
+    callback (optional) is called with the record of every operation when it ends,
+    snapshot() gives the totals by operation.
+    """
+
+    def __init__(self, callback=None):
+        global _audited
+        self.callback = callback
+        self.__operations = dict()
+        self.__mutex = threading.Lock()
+        with _audit_mutex:
+            if not _audited:
+                # audit hooks can't be removed, it's added with the first Stats
+                sys.addaudithook(_count_opens)
+                _audited = True
+
+    @contextmanager
+    def __running(self, record):
+        outer, _observed.operation = _observed.operation, record
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as error:
+            record["error"] = type(error).__name__
+            raise
+        finally:
+            record["seconds"] += time.perf_counter() - start
+            _observed.operation = outer
+
+    def __finish(self, record):
+        with self.__mutex:
+            total = self.__operations.setdefault(record["operation"], {
+                "calls": 0, "errors": 0, "seconds": 0.0, "files_opened": 0, "bytes_read": 0, "bytes_written": 0,
+                "phases": dict()})
+            total["calls"] += 1
+            total["errors"] += record["error"] is not None
+            for key in ("seconds", "files_opened", "bytes_read", "bytes_written"):
+                total[key] += record[key]
+            for name, phase in record["phases"].items():
+                phase_ = total["phases"].setdefault(name, {"calls": 0, "seconds": 0.0, "bytes": 0})
+                for key in phase_:
+                    phase_[key] += phase[key]
+        if self.callback is not None:
+            self.callback(record)
+
+    @staticmethod
+    def __record(name):
+        return {"operation": name, "seconds": 0.0, "error": None, "files_opened": 0, "bytes_read": 0,
+                "bytes_written": 0, "phases": dict()}
+
+    @contextmanager
+    def operation(self, name):
+        try:
+            with self.__running(record := self.__record(name)):
+                yield
+        finally:
+            self.__finish(record)
+
+    def iterate(self, name, iterator):
+        # an operation consumed lazily (select), the time spent by the caller between the items isn't counted
+        record = self.__record(name)
+        try:
+            while True:
+                with self.__running(record):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            self.__finish(record)
+
+    def record(self, name, seconds, size=0):
+        # a phase of the running operation
+        if (record := _observed.operation) is None:
+            return
+        phase = record["phases"].setdefault(name, {"calls": 0, "seconds": 0.0, "bytes": 0})
+        phase["calls"] += 1
+        phase["seconds"] += seconds
+        phase["bytes"] += size
+        if name == "read":
+            record["bytes_read"] += size
+        elif name in ("write", "switch"):
+            record["bytes_written"] += size
+
+    @contextmanager
+    def phase(self, name, size=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, size)
+
+    def snapshot(self):
+        # {operation: {calls, errors, seconds, files_opened, bytes_read, bytes_written, phases}}
+        with self.__mutex:
+            return {name: dict(total, phases={phase: dict(values) for phase, values in total["phases"].items()})
+                    for name, total in self.__operations.items()}
+
+    def reset(self):
+        with self.__mutex:
+            self.__operations.clear()
+
+
+def _observed_by(method):
+    # the method is an operation of the instance's observer, when it has one
+    name = method.__name__.strip("_")
+
+    @wraps(method)
+    def observed(self, *args, **kwargs):
+        if self._observer is None:
+            return method(self, *args, **kwargs)
+        with self._observer.operation(name):
+            return method(self, *args, **kwargs)
+    return observed
+
+
+def _shared(method):
+    # the method reads the table, under its shared lock
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock.shared(self._observer):
+            return method(self, *args, **kwargs)
+    return _observed_by(locked)
+
+
+def _exclusive(method):
+    # the method rewrites the table's files, under its exclusive lock and after a checkpoint of the WAL
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock.exclusive(self._observer):
+            self._wal.checkpoint()
+            self._wal.rebuilt()
+            self._check_key()
+            return method(self, *args, **kwargs)
+    return _observed_by(locked)
+
+
+def _writes(method):
+    # the method changes rows, under the exclusive lock and in a transaction (the caller's or its own)
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock.exclusive(self._observer), self._wal.transaction(observer=self._observer):
+            self._check_key()
+            return method(self, *args, **kwargs)
+    return _observed_by(locked)
+
+
+class _Journal:
+    """
+    Append-only journal file of pickled entries, replayed once into memory with apply.
+    Every access checks the file, entries appended by other instances are applied
+    and a rewritten file (compact) is replayed from the start.
+    """
+
+    def __init__(self, file, wal=None, observer=None):
+        self.file = file
+        self.wal = wal
+        self.observer = observer
+        self.__offset = 0
+        self.__inode = None
+        self.__generation = None if wal is None else wal.generation
+        # instances are shared between threads, the replay runs in one of them at a time
+        self.mutex = threading.RLock()
+
+    def reset(self):
+        raise NotImplementedError
+
+    def apply(self, entry):
+        raise NotImplementedError
+
+    def entries(self):
+        # the live entries, written by compact
+        raise NotImplementedError
+
+    def refresh(self):
+        # pick up entries appended by other instances, reload if the file was rewritten
+        with self.mutex:
+            if self.wal is not None:
+                self.wal.flush(self.file)
+                if self.__generation != self.wal.generation:
+                    # a transaction was rolled back, replay the file again
+                    self.__generation, self.__inode = self.wal.generation, None
+            st = os.stat(self.file)
+            if st.st_ino != self.__inode or st.st_size < self.__offset:
+                self.reset()
+                self.__offset = 0
+                self.__inode = st.st_ino
+            if st.st_size == self.__offset:
+                return
+            with open(self.file, 'rb') as r:
+                r.seek(self.__offset)
+                while True:
+                    try:
+                        entry = pickle.load(r)
+                    except (EOFError, pickle.UnpicklingError, ValueError):
+                        break
+                    self.apply(entry)
+                    self.__offset = r.tell()
+
+    def write(self, entries):
+        if not entries:
+            return
+        with self.mutex:
+            self.refresh()
+            data = _dumps(entries)
+            with nullcontext() if self.observer is None else self.observer.phase("write", len(data)):
+                if self.wal is not None and self.wal.write(self.file, data):
+                    # in a transaction, the file is written on commit
+                    for entry in entries:
+                        self.apply(entry)
+                    return
+                _write(self.file, data)
+            self.refresh()
+
+    def compact(self):
+        # rewrite the journal with the live entries only, the new file replaces the old one at once
+        with self.mutex:
+            self.refresh()
+            with open(temp := f"{self.file}.tmp", 'wb') as w:
+                for entry in self.entries():
+                    pickle.dump(entry, w)
+                w.flush()
+                os.fsync(w.fileno())
+            _writable(self.file)
+            os.replace(temp, self.file)
+            _read_only(self.file)
+            self.refresh()
+
+
+class _Index(_Journal):
+    """
+    Row index, maps the hashed row to its "d:counter:" path.
+    The index file is an append-only journal of (hashed row, path) pairs where a None path
+    marks a dropped row, it is replayed once into a dict so lookups don't scan D_Tree.
+    """
+
+    def __init__(self, file, d_tree, d_tree_backup, sides=None, wal=None, observer=None):
+        super().__init__(file, wal, observer)
+        self.sides = sides
+        self.rows = dict()
+        if not os.path.isfile(self.file):
+            # tables made before the index existed, build it from D_Tree once
+            self.__build(d_tree, d_tree_backup)
+        self.refresh()
+
+    def __build(self, d_tree, d_tree_backup):
+        # under the table's exclusive lock, a row inserted meanwhile by another process isn't missed
+        with _per_table(_TableLock, os.path.join(os.path.dirname(self.file), "Lock")).exclusive():
+            if os.path.isfile(self.file):
+                # built by another instance meanwhile
+                return
+            rows = _live(_records(d_tree_backup if _is_backup(file=d_tree) else d_tree))
+            with open(temp := f"{self.file}.tmp", 'wb') as w:
+                for pass_id, path in rows.items():
+                    pickle.dump((pass_id, path), w)
+            os.replace(temp, self.file)
+            _read_only(self.file)
+
+    def reset(self):
+        self.rows.clear()
+        if self.sides is not None:
+            # the table was compacted, files may have switched sides
+            self.sides.clear()
+
+    def apply(self, entry):
+        pass_id, path = entry
+        if path is None:
+            self.rows.pop(pass_id, None)
+        else:
+            self.rows[pass_id] = path
+
+    def entries(self):
+        return self.rows.items()
+
+    def get(self, pass_id):
+        if self.observer is None:
+            self.refresh()
+            return self.rows.get(pass_id)
+        with self.observer.phase("index"):
+            self.refresh()
+            return self.rows.get(pass_id)
+
+    def get_many(self, pass_ids):
+        # {hashed row: path} of the rows that exist, with one refresh
+        with nullcontext() if self.observer is None else self.observer.phase("index"):
+            self.refresh()
+            return {pass_id: path for pass_id in pass_ids if (path := self.rows.get(pass_id)) is not None}
+
+    def __contains__(self, pass_id):
+        return self.get(pass_id) is not None
+
+    def __len__(self):
+        self.refresh()
+        return len(self.rows)
+
+    def add(self, pass_id, path):
+        self.write([(pass_id, path)])
+
+    def extend(self, entries):
+        self.write(list(entries))
+
+    def discard(self, pass_id):
+        self.write([(pass_id, None)])
+
+
+def _canonical(value):
+    """
+    Text of a cell value that is the same for equal values, so they get the same hash in a column index.
+    Equal numbers are written alike (1, 1.0 and True), sets and dicts with their items sorted,
+    the other types with repr.
+    """
+    if isinstance(value, numbers.Number) and value == value:
+        if value.imag:
+            return repr(complex(value))
+        try:
+            if value == (integer := int(value.real)):
+                return repr(integer)
+        except OverflowError:
+            # inf
+            pass
+        if value == (real := float(value.real)):
+            return repr(real)
+    elif isinstance(value, list):
+        return f"[{', '.join(_canonical(item) for item in value)}]"
+    elif isinstance(value, tuple):
+        return f"({', '.join(_canonical(item) for item in value)}{',' if len(value) == 1 else ''})"
+    elif isinstance(value, (set, frozenset)):
+        return f"{{{', '.join(sorted(_canonical(item) for item in value))}}}"
+    elif isinstance(value, dict):
+        return f"{{{', '.join(sorted(f'{_canonical(key)}: {_canonical(item)}' for key, item in value.items()))}}}"
+    return repr(value)
+
+
+def _hashed_value(key_, value):
+    # a cell value in a column index
+    return _hash_(f"{key_}:{_canonical(value)}")
+
+
+class _ColumnIndex(_Journal):
+    """
+    Secondary index of a column, maps the hashed cell value to the set of hashed rows that have it.
+    The journal entries are (hashed value, hashed row, present), the values are hashed with
+    the table's key so the index doesn't leak the data.
+    """
+
+    def __init__(self, file, key_, wal=None, observer=None):
+        super().__init__(file, wal, observer)
+        self.key = key_
+        self.values = dict()
+        if not os.path.isfile(self.file):
+            with open(self.file, 'wb'):
+                _read_only(self.file)
+        self.refresh()
+
+    def hashed(self, value):
+        return _hashed_value(self.key, value)
+
+    def reset(self):
+        self.values.clear()
+
+    def apply(self, entry):
+        hashed_value, pass_id, present = entry
+        if present:
+            self.values.setdefault(hashed_value, set()).add(pass_id)
+        elif (rows := self.values.get(hashed_value)) is not None:
+            rows.discard(pass_id)
+            if not rows:
+                del self.values[hashed_value]
+
+    def entries(self):
+        return ((hashed_value, pass_id, True) for hashed_value, rows in self.values.items() for pass_id in rows)
+
+    def get(self, value):
+        with nullcontext() if self.observer is None else self.observer.phase("index"):
+            self.refresh()
+            return set(self.values.get(self.hashed(value), ()))
+
+
+class _ColumnIndexes:
+    """
+    The table's secondary indexes, Indexes.pickle lists the indexed columns and
+    each column has its own _ColumnIndex journal, all of them under _MetaData_.
+    """
+
+    def __init__(self, meta_data, key_, wal=None, observer=None):
+        self.__MetaData = meta_data
+        self.__registry = os.path.join(f"{self.__MetaData}", "Indexes.pickle")
+        self.key = key_
+        self.wal = wal
+        self.observer = observer
+        self.columns = dict()
+        self.__state = None
+        self.__mutex = threading.Lock()
+
+    def refresh(self):
+        # an index created by another instance is picked up on the next access
+        try:
+            st = os.stat(self.__registry)
+        except FileNotFoundError:
+            return
+        with self.__mutex:
+            if (state := (st.st_ino, st.st_size, st.st_mtime_ns)) != self.__state:
+                with open(self.__registry, 'rb') as r:
+                    columns = pickle.load(r)
+                self.columns = {column: self.columns.get(column) or
+                                _ColumnIndex(os.path.join(f"{self.__MetaData}", f"Index_{_hash_(column)}.pickle"),
+                                             self.key, self.wal, self.observer)
+                                for column in columns}
+                self.__state = state
+
+    def __bool__(self):
+        self.refresh()
+        return bool(self.columns)
+
+    def create(self, column, rows):
+        # rows => (hashed row, {column: data}) of the whole table
+        self.refresh()
+        if column in self.columns:
+            return
+        index = _ColumnIndex(os.path.join(f"{self.__MetaData}", f"Index_{_hash_(column)}.pickle"), self.key,
+                             self.wal, self.observer)
+        index.write([(index.hashed(cells[column]), pass_id, True) for pass_id, cells in rows if column in cells])
+
+        if os.path.isfile(self.__registry):
+            _writable(self.__registry)
+        with open(self.__registry, 'wb') as w:
+            pickle.dump(tuple(self.columns) + (column,), w)
+        _read_only(self.__registry)
+        self.refresh()
+
+    def change(self, changes):
+        """
+        Keep the indexes current, changes => [(hashed row, old {column: data}, new {column: data}), ...]
+        old is None for a new row and new is None for a dropped row, one write per index.
+        """
+        self.refresh()
+        for column, index in self.columns.items():
+            entries = []
+            for pass_id, old, new in changes:
+                old_ = (old or {}).get(column, _missing)
+                new_ = (new or {}).get(column, _missing)
+                if old_ is not _missing and (new_ is _missing or old_ != new_):
+                    entries.append((index.hashed(old_), pass_id, False))
+                if new_ is not _missing and (old_ is _missing or old_ != new_):
+                    entries.append((index.hashed(new_), pass_id, True))
+            index.write(entries)
+
+    def get(self, column, value):
+        self.refresh()
+        if column not in self.columns:
+            raise dbTableError(f"There is no index on column {column}, use create_index(column={column!r}).")
+        return self.columns[column].get(value)
+
+
+class _Catalog(_Journal):
+    """
+    The tables of a database, _Catalog_.pickle in the db_name folder, so listing them doesn't
+    walk the tables' folders. The journal entries are (table name, hashed folder, columns)
+    and (table name, None) for a dropped table, written under the database's _Catalog_.lock.
+    A database without a catalog (made by an older version) gets one from the tables' T_state.xml.
+    """
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.path = os.path.dirname(file)
+        self.tables = dict()
+        self.lock = _per_table(_TableLock, os.path.join(f"{self.path}", "_Catalog_.lock"))
+
+    def reset(self):
+        self.tables.clear()
+
+    def apply(self, entry):
+        if entry[1] is None:
+            self.tables.pop(entry[0], None)
+        else:
+            self.tables[entry[0]] = entry[1:]
+
+    def entries(self):
+        return ((name, *entry) for name, entry in self.tables.items())
+
+    def refresh(self):
+        if not os.path.isfile(self.file):
+            self.rebuild()
+        super().refresh()
+
+    def rebuild(self):
+        # list the tables again from their T_state.xml files
+        with self.lock.exclusive():
+            with open(temp := f"{self.file}.tmp", 'wb') as w:
+                for folder in sorted(os.listdir(self.path)):
+                    if os.path.isfile(xml_ts := os.path.join(f"{self.path}", f"{folder}", "_MetaData_",
+                                                             "T_state.xml")):
+                        xml = _XML(xml_ts)
+                        pickle.dump((xml.access(path=True), folder, tuple(xml.access()[0])), w)
+                w.flush()
+                os.fsync(w.fileno())
+            if os.path.isfile(self.file):
+                _writable(self.file)
+            os.replace(temp, self.file)
+            _read_only(self.file)
+            super().refresh()
+
+    def add(self, name, folder, columns):
+        with self.lock.exclusive():
+            self.refresh()
+            if self.tables.get(name) != (folder, tuple(columns)):
+                self.write([(name, folder, tuple(columns))])
+
+    def drop(self, name):
+        with self.lock.exclusive():
+            self.refresh()
+            if name in self.tables:
+                self.write([(name, None)])
+
+    def names(self):
+        self.refresh()
+        with self.mutex:
+            return list(self.tables)
+
+    def items(self):
+        self.refresh()
+        with self.mutex:
+            return list(self.tables.items())
+
+
+class _Dictionaries(_Journal):
+    """
+    Compression dictionaries of a table's _D_ files, made by compact (_Rebuild) from the live rows of each file.
+    The file is an append-only journal of (d, dictionary id, encrypted dictionary), the dictionaries
+    hold samples of the rows so they are encrypted with the table's key.
+    Every dictionary is kept until compact, a record names the one it was compressed with.
+    """
+
+    def __init__(self, file, key_, cipher, wal=None, observer=None):
+        super().__init__(file, wal, observer)
+        self.key = key_
+        self.cipher = cipher
+        # dictionary id => dictionary, d => dictionary id
+        self.dictionaries = dict()
+        self.segments = dict()
+        if not os.path.isfile(self.file):
+            with open(self.file, 'wb'):
+                _read_only(self.file)
+        self.refresh()
+
+    def reset(self):
+        self.dictionaries.clear()
+        self.segments.clear()
+
+    def apply(self, entry):
+        d, dictionary_id, encrypted_dictionary = entry
+        self.dictionaries[dictionary_id] = self.cipher.decrypt(encrypted_dictionary, self.key, 'latin-1')
+        self.segments[d] = dictionary_id
+
+    def entries(self):
+        return [(d, dictionary_id, self.cipher.encrypt(self.dictionaries[dictionary_id], self.key, 'latin-1'))
+                for d, dictionary_id in self.segments.items()]
+
+    def __getitem__(self, dictionary_id):
+        # a dictionary made by another instance is picked up on the way
+        if dictionary_id not in self.dictionaries:
+            self.refresh()
+        return self.dictionaries[dictionary_id]
+
+    def all(self):
+        # {dictionary id: dictionary}, for the workers of Extract.scan
+        self.refresh()
+        return dict(self.dictionaries)
+
+    def get(self, d):
+        # the dictionary of the _D_ file d, None before its first compact
+        self.refresh()
+        return self.dictionaries.get(self.segments.get(d))
+
+    @staticmethod
+    def sample(payloads):
+        """
+        The dictionary of a _D_ file made from the payloads of its rows, 1/16 of their size
+        up to 32 kB (zlib's window), the strings at the end are the cheapest to refer to.
+        """
+        sample = b"".join(payloads)
+        return sample[len(sample) - min(32768, len(sample) // 16):] or None
+
+
+def _catalog(path):
+    # the catalog of the database in the path folder, one per process
+    return _per_table(_Catalog, os.path.join(f"{path}", "_Catalog_.pickle"))
+
+
+def _matches(conditions, cells):
+    # where={column: data} of select and scan
+    return all(column in cells and cells[column] == data for column, data in conditions.items())
+
+
+def _merged(data_dicts):
+    # {row: {column: data}} of decoded records, the column groups of a row merged in one dict
+    merged = dict()
+    for data_dict in data_dicts:
+        for row, cells in data_dict.items():
+            if (cells_ := merged.setdefault(row, cells)) is not cells:
+                cells_.update(cells)
+    return merged
+
+
+def _scan_segment(file, key_, codec, cipher, compression, dictionaries, where, columns, function, reduce):
+    # worker of Extract.scan, the results of the live rows of one _D_ file
+    codec, cipher, compression = _codec(codec), _cipher(cipher), _compression(compression)
+    if isinstance(where, dict):
+        where = partial(_matches, where)
+    results = []
+    rows = _merged(_decode(encrypted_data, key_, codec, cipher, compression, dictionaries)
+                   for encrypted_data in _live(_records(file)).values())
+    for row, cells in rows.items():
+        if where is not None and not where(cells):
+            continue
+        if columns is not None:
+            cells = {str(column): cells[str(column)] for column in columns if str(column) in cells}
+        results.append((row, cells) if function is None else function(row, cells))
+    if reduce is None:
+        return results
+    return (True, _reduce(reduce, results)) if results else (False, None)
+
+
+class _MappedSegments:
+    """
+    Offset tables of the _D_ files read by an instance, {record key: (offset, length)} of the last record
+    of each key, a row is read from the mapped file (mmap) with one slice and one unpickle instead of
+    reading the file from the start.
+    A table is made by reading its file once and kept current by reading what was appended since,
+    a file replaced (compact) or cut back (rollback) is read again. At most maxsize files are mapped,
+    the least recently used is closed.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # file => (inode, offset of the end of the last record, offsets, mmap)
+        self.__segments = OrderedDict()
+        self.__mutex = threading.Lock()
+
+    def __segment(self, file):
+        st = os.stat(file)
+        if (entry := self.__segments.get(file)) is None or entry[0] != st.st_ino or st.st_size < entry[1]:
+            if entry is not None and entry[3] is not None:
+                entry[3].close()
+            entry = (st.st_ino, 0, dict(), None)
+
+        if st.st_size > entry[1]:
+            inode, end, offsets, mapped = entry
+            with open(file, 'rb') as r:
+                r.seek(start := end)
+                for record in _records(r):
+                    end = r.tell()
+                    for key, value in record.items():
+                        offsets[key] = None if value is None else (start, end)
+                    start = end
+                if end != entry[1]:
+                    if mapped is not None:
+                        mapped.close()
+                    mapped = mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_READ)
+            entry = (inode, end, offsets, mapped)
+
+        self.__segments[file] = entry
+        self.__segments.move_to_end(file)
+        while len(self.__segments) > self.maxsize:
+            if (mapped := self.__segments.popitem(last=False)[1][3]) is not None:
+                mapped.close()
+        return entry
+
+    def fetch(self, file, pass_ids):
+        # the encrypted records {record key: record} of the live keys in pass_ids
+        with self.__mutex:
+            _, _, offsets, mapped = self.__segment(file)
+            records = dict()
+            for pass_id in pass_ids:
+                if (location := offsets.get(pass_id)) is not None:
+                    records[pass_id] = pickle.loads(mapped[location[0]:location[1]])[pass_id]
+            return records
+
+    def close(self):
+        with self.__mutex:
+            for _, _, _, mapped in self.__segments.values():
+                if mapped is not None:
+                    mapped.close()
+            self.__segments.clear()
+
+
+class _RowCache:
+    """
+    Bounded LRU cache of decrypted records keyed by their record key (the hashed row, and the column group).
+    Each entry keeps the stamp of its _D_ file, a different stamp (a write from any instance)
+    is a miss, so the cache never returns a stale row.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__rows = OrderedDict()
+        self.__mutex = threading.Lock()
+
+    def get(self, pass_id, stamp):
+        with self.__mutex:
+            if (entry := self.__rows.get(pass_id)) is not None and entry[0] == stamp:
+                self.__rows.move_to_end(pass_id)
+                self.hits += 1
+                # copies, callers change the returned dict (update, remove)
+                return {row: dict(cells) for row, cells in entry[1].items()}
+            self.misses += 1
+            return None
+
+    def put(self, pass_id, stamp, data_dict):
+        with self.__mutex:
+            self.__rows[pass_id] = (stamp, {row: dict(cells) for row, cells in data_dict.items()})
+            self.__rows.move_to_end(pass_id)
+            while len(self.__rows) > self.maxsize:
+                self.__rows.popitem(last=False)
+
+    def discard(self, pass_id):
+        with self.__mutex:
+            self.__rows.pop(pass_id, None)
+
+    def clear(self):
+        with self.__mutex:
+            self.__rows.clear()
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "maxsize": self.maxsize, "currsize": len(self.__rows)}
+
+
+def _remove_tree(path):
+    # remove a folder and its read-only files
+    for folder, _, files in os.walk(path):
+        for file in files:
+            os.chmod(os.path.join(f"{folder}", f"{file}"), stat.S_IWRITE)
+    shutil.rmtree(path)
+
+
+def _finish_rebuild(table_location):
+    """
+    Move the files of a committed rebuild (Extract.compact and rekey) over the table's files,
+    a rebuild interrupted after its commit is finished when the table is opened again
+    or before its next write.
+    The _D_ files after the last one of the rebuild are removed. False when there is no commit.
+    """
+    rebuild = os.path.join(f"{table_location}", "_Rebuild_")
+    if not os.path.isfile(commit := os.path.join(f"{rebuild}", "COMMIT")):
+        return False
+    with _per_table(_TableLock, os.path.join(f"{table_location}", "_MetaData_", "Lock")).exclusive():
+        if not os.path.isfile(commit):
+            # finished by another instance meanwhile
+            return False
+        with open(commit, 'rb') as r:
+            segments = pickle.load(r)
+        for folder in ("_Database_", "_MetaData_"):
+            for file in os.listdir(staged := os.path.join(f"{rebuild}", f"{folder}")):
+                if os.path.isfile(live := os.path.join(f"{table_location}", f"{folder}", f"{file}")):
+                    _writable(live)
+                os.replace(os.path.join(f"{staged}", f"{file}"), live)
+        for file in os.listdir(db := os.path.join(f"{table_location}", "_Database_")):
+            if file.startswith(("_D_", "backup_D_")) and file.endswith(".pickle") \
+                    and int(file.rpartition("_D_")[2][:-7]) > segments:
+                os.chmod(file_ := os.path.join(f"{db}", f"{file}"), stat.S_IWRITE)
+                os.remove(file_)
+        _remove_tree(rebuild)
+    return True
+
+
+class _Rebuild:
+    """
+    The table written again by Extract.compact and rekey, in _Rebuild_ next to _Database_ and _MetaData_.
+    The live rows are added in storage order one _D_ file at a time, they get new paths without holes
+    and are written segment_size at a time with key_, so one _D_ file in and one out are in memory.
+    D_Tree, rows, Index, the column indexes and the compression dictionaries are written on the way,
+    the rows written to the table meanwhile are written again with update and drop (appended at
+    their new paths), commit and _finish_rebuild put all the files in place at once.
+    """
+
+    def __init__(self, table_location, insert, key_, indexed=()):
+        self.location = os.path.join(f"{table_location}", "_Rebuild_")
+        self.insert = insert
+        self.key = key_
+        self.segments = 0
+        self.count = 0
+        # hashed row => [new path, row, {indexed column: hashed value}] of the rows written so far
+        self.rows = dict()
+        # the _D_ files of the table read so far, d => (side, inode, offset of the end)
+        self.sources = dict()
+        self.__rows = dict()
+        self.__deleted = []
+        if os.path.isdir(self.location):
+            # left by a rebuild that didn't commit
+            _remove_tree(self.location)
+        self.__db = os.path.join(f"{self.location}", "_Database_")
+        self.meta_data = os.path.join(f"{self.location}", "_MetaData_")
+        os.makedirs(self.__db)
+        os.mkdir(self.meta_data)
+        self.__D_Tree = open(os.path.join(f"{self.meta_data}", "D_Tree.pickle"), 'wb')
+        self.__row_collections = open(os.path.join(f"{self.meta_data}", "rows.pickle"), 'wb')
+        self.__Index = open(os.path.join(f"{self.meta_data}", "Index.pickle"), 'wb')
+        self.__indexes = {column: open(os.path.join(f"{self.meta_data}", f"Index_{_hash_(column)}.pickle"), 'wb')
+                          for column in indexed}
+        self.__dictionaries = None if insert.dictionaries is None else \
+            open(os.path.join(f"{self.meta_data}", "Dictionaries.pickle"), 'wb')
+
+    def add(self, row, cells):
+        if (pass_id := _hash_(str(row))) in self.rows:
+            # dropped and inserted again in a _D_ file read later
+            self.drop(pass_id)
+        self.__rows.pop(pass_id, None)
+        self.__rows[pass_id] = (row, cells)
+        if len(self.__rows) == self.insert.segment_size:
+            self.__flush()
+
+    def __encrypted(self, records, dictionary=None):
+        # [{record key: encrypted record}, ...] of [(record key, payload), ...] with key_
+        if self.insert.compression is not None:
+            records = [(key, self.insert.compression.compress(payload, dictionary)) for key, payload in records]
+        return [{key: self.insert.cipher.encrypt(payload, self.key, self.insert.encoding())}
+                for key, payload in records]
+
+    def __write(self, d, records):
+        # append to a _D_ file of the rebuild, synced on commit
+        file = os.path.join(f"{self.__db}", f"_D_{d}.pickle")
+        data = _dumps(records)
+        with nullcontext() if self.insert.observer is None else self.insert.observer.phase("write", len(data)):
+            if not os.path.isfile(file):
+                with open(file_backup := os.path.join(f"{self.__db}", f"backup_D_{d}.pickle"), 'wb'):
+                    _read_only(file_backup)
+            _write(file, data)
+
+    def __index(self, pass_id, old, new):
+        # the column index entries of a row, old and new => {indexed column: hashed value}
+        for column, index in self.__indexes.items():
+            if column in old and old[column] != new.get(column):
+                pickle.dump((old[column], pass_id, False), index)
+            if column in new and new[column] != old.get(column):
+                pickle.dump((new[column], pass_id, True), index)
+
+    def __flush(self):
+        d = self.segments = self.segments + 1
+        records = [(key, self.insert.codec.dumps(data)) for row, cells in self.__rows.values()
+                   for key, data in self.insert.split(row, {f"{row}": cells})]
+        dictionary = None
+        if self.__dictionaries is not None and (dictionary := _Dictionaries.sample(
+                payload for _, payload in records)) is not None:
+            pickle.dump((d, zlib.adler32(dictionary), self.insert.cipher.encrypt(dictionary, self.key, 'latin-1')),
+                        self.__dictionaries)
+        self.__write(d, self.__encrypted(records, dictionary))
+
+        for counter, (pass_id, (row, cells)) in enumerate(self.__rows.items(), 1):
+            path = f"{d}:{counter}:"
+            pickle.dump({pass_id: path}, self.__D_Tree)
+            pickle.dump(self.insert.row_record(row, self.key), self.__row_collections)
+            pickle.dump((pass_id, path), self.__Index)
+            hashed = {column: _hashed_value(self.key, cells[column]) for column in self.__indexes if column in cells}
+            self.__index(pass_id, {}, hashed)
+            self.rows[pass_id] = [path, row, hashed]
+        self.count += len(self.__rows)
+        self.__rows = dict()
+
+    def close(self):
+        # the last rows, after them the rows are written one at a time by update and drop
+        if self.__rows:
+            self.__flush()
+
+    def update(self, row, records):
+        """
+        A row written to the table since it was added, or a new one (at the next path).
+        records => [(record key, {row: {column: data}}), ...] of the column groups that were written.
+        """
+        pass_id = _hash_(str(row))
+        if (written := self.rows.get(pass_id)) is None:
+            if self.count % self.insert.segment_size == 0:
+                self.segments += 1
+            path = f"{self.segments}:{self.count - (self.segments - 1) * self.insert.segment_size + 1}:"
+            self.count += 1
+            pickle.dump({pass_id: path}, self.__D_Tree)
+            pickle.dump(self.insert.row_record(row, self.key), self.__row_collections)
+            pickle.dump((pass_id, path), self.__Index)
+            written = [path, row, {}]
+        # the last record wins, the records are appended without a compression dictionary
+        self.__write(written[0].split(':')[0], self.__encrypted(
+            [(key, self.insert.codec.dumps(data)) for key, data in records]))
+        groups = {key: cells for key, data in records for cells in data.values()}
+        hashed = dict(written[2])
+        for column in self.__indexes:
+            if (cells := groups.get(self.insert.keys(pass_id, (column,))[0])) is None:
+                continue
+            if column in cells:
+                hashed[column] = _hashed_value(self.key, cells[column])
+            else:
+                hashed.pop(column, None)
+        self.__index(pass_id, written[2], hashed)
+        self.rows[pass_id] = [written[0], row, hashed]
+
+    def drop(self, pass_id):
+        # a row dropped from the table since it was added, its path is reused by the next insert
+        if (written := self.rows.pop(pass_id, None)) is None:
+            return
+        path, row, hashed = written
+        self.__write(path.split(':')[0], [{key: None for key in self.insert.keys(pass_id)}])
+        pickle.dump({pass_id: None}, self.__D_Tree)
+        pickle.dump({self.insert.row_record(row, self.key) if self.insert.bare_rows else pass_id: None},
+                    self.__row_collections)
+        pickle.dump((pass_id, None), self.__Index)
+        self.__index(pass_id, hashed, {})
+        self.__deleted.append(path)
+
+    def abort(self):
+        # the files are left to the next rebuild, which removes them
+        for w in (self.__D_Tree, self.__row_collections, self.__Index, *self.__indexes.values(),
+                  *([] if self.__dictionaries is None else [self.__dictionaries])):
+            w.close()
+
+    def commit(self):
+        # Track and the empty backups, all the files synced, from here on the rebuild is finished by
+        # _finish_rebuild, even after a crash
+        for w in (self.__D_Tree, self.__row_collections, self.__Index, *self.__indexes.values(),
+                  *([] if self.__dictionaries is None else [self.__dictionaries])):
+            w.flush()
+            os.fsync(w.fileno())
+            w.close()
+            _read_only(w.name)
+        for d in range(1, self.segments + 1):
+            _fsync(os.path.join(f"{self.__db}", f"_D_{d}.pickle"))
+        last_entry = f"{self.segments}:{self.count - (self.segments - 1) * self.insert.segment_size}:" \
+            if self.count else 0
+        with open(track := os.path.join(f"{self.meta_data}", "Track.pickle"), 'wb') as w:
+            pickle.dump({"last_entry": last_entry, "deleted_id": self.__deleted, "tree_track": len(self.rows)}, w)
+            w.flush()
+            os.fsync(w.fileno())
+        _read_only(track)
+        for name in ("D_Tree_backup.pickle", "rows_backup.pickle"):
+            with open(file := os.path.join(f"{self.meta_data}", name), 'wb'):
+                _read_only(file)
+
+        with open(temp := os.path.join(f"{self.location}", "COMMIT.tmp"), 'wb') as w:
+            pickle.dump(self.segments, w)
+            w.flush()
+            os.fsync(w.fileno())
+        os.replace(temp, os.path.join(f"{self.location}", "COMMIT"))
 
 
 class _Insert(_Location):
     """ initializing data (using pickle) to be stored in files """
 
-    def __init__(self, db_path=current_directory, db_name="_dbTables_", encrypt_key=default_key, table_name=None):
+    def __init__(self, db_path=current_directory, db_name="_dbTables_", encrypt_key=default_key, table_name=None,
+                 segment_size=default_segment_size, codec=default_codec, cipher=default_cipher, observer=None,
+                 mapped_segments=0, column_groups=(), compression=None, compression_dictionary=False):
         super().__init__(db_path, db_name)
 
         self.Key = encrypt_key
+        self.observer = observer
+        # offset tables and maps of the _D_ files, by default (None) for the tables with column groups, their
+        # records are read one at a time instead of reading the records of the other groups with them
+        if mapped_segments is None:
+            mapped_segments = default_grouped_segments if column_groups else 0
+        self.mapped = _MappedSegments(mapped_segments) if mapped_segments else None
+        self.segment_size = int(segment_size)
+        self.codec = _codec(codec)
+        self.cipher = _cipher(cipher)
+        self.compression = _compression(compression)
+        # column => column group, the columns of no group are in group 0
+        self.groups = {str(column): g for g, group in enumerate(column_groups, 1) for column in group}
         self.__db_name = db_name
         self.__TableName = table_name
         self.__Table_location = os.path.join(f"{self.path}", f"{_hash_(self.__TableName)}")
         self.__db = os.path.join(f"{self.__Table_location}", f"_Database_")
         self.__MetaData = os.path.join(f"{self.__Table_location}", f"_MetaData_")
         self.__Track = os.path.join(f"{self.__MetaData}", "Track.pickle")
+        self.__Index = os.path.join(f"{self.__MetaData}", "Index.pickle")
+        # shared by reads, exclusive for writes, between threads and processes
+        self.lock = _per_table(_TableLock, os.path.join(f"{self.__MetaData}", "Lock"))
+        self.wal = _per_table(_WAL, os.path.join(f"{self.__MetaData}", "WAL.pickle"))
+        self.sides = _Sides(self.wal, observer)
+        # compression dictionaries of the _D_ files, made by compact
+        self.dictionaries = _Dictionaries(os.path.join(f"{self.__MetaData}", "Dictionaries.pickle"), self.Key,
+                                          self.cipher, wal=self.wal, observer=observer) \
+            if compression_dictionary else None
+
+        if self.wal.dirty():
+            # a transaction left by a crash is finished before the table is used
+            with self.lock.exclusive():
+                self.wal.recover()
 
     def delete(self, path, row):
-
-        value = path.split(':')
-        data_path = os.path.join(f"{self.__db}", f"_D_{value[0]}.pickle")
-        backup_data_path = os.path.join(f"{self.__db}", f"backup_D_{value[0]}.pickle")
-        _F_B_switch(file=data_path, backup=backup_data_path, change=_hash_(str(row)))
+        # append a tombstone of every column group, the records are reclaimed by compact
+        file, file_backup = self.__files(path.split(':')[0])
+        self.sides.append(file=file, backup=file_backup,
+                          records=[{key: None for key in self.keys(_hash_(str(row)))}])
         self.track(key="deleted_id", data=path)
 
+    def __groups(self, columns=None):
+        # the column groups of columns, all of them without columns
+        if columns is None:
+            return range(max(self.groups.values(), default=0) + 1)
+        return sorted({self.groups.get(str(column), 0) for column in columns})
+
+    def keys(self, pass_id, columns=None):
+        # the record keys of a row, the hashed row for group 0 and "hashed row:group" for the others
+        return [pass_id if group == 0 else f"{pass_id}:{group}" for group in self.__groups(columns)]
+
+    def split(self, row, _data_, columns=None):
+        # (record key, {row: {column: data}}) of a row, one per column group, with columns only their groups
+        pass_id = _hash_(str(row))
+        if not self.groups:
+            return [(pass_id, _data_)]
+        groups = {group: dict() for group in self.__groups(columns)}
+        for column, data in _data_[f"{row}"].items():
+            if (group := self.groups.get(column, 0)) in groups:
+                groups[group][column] = data
+        return [(key, {f"{row}": cells}) for key, cells in zip(self.keys(pass_id, columns), groups.values())]
+
+    def records(self, row, _data_, d, columns=None):
+        """
+        The encrypted records [{record key: record}, ...] of a row in the _D_ file d, one per column group,
+        with columns only the records of their groups (an update of those columns).
+        """
+        return [{key: self.encode(data, d)} for key, data in self.split(row, _data_, columns)]
+
+    def encode(self, _data_, d=None, codec=None):
+        # d is the _D_ file of the record, for its compression dictionary
+        codec = codec or self.codec
+        if self.compression is None and self.observer is None:
+            return self.cipher.encrypt(codec.dumps(_data_), self.Key, codec.encoding)
+        start = time.perf_counter()
+        payload = codec.dumps(_data_)
+        if self.observer is not None:
+            self.observer.record("encode", (start_ := time.perf_counter()) - start, len(payload))
+        if self.compression is not None:
+            dictionary = None if self.dictionaries is None or d is None else self.dictionaries.get(int(d))
+            payload = self.compression.compress(payload, dictionary)
+            if self.observer is not None:
+                self.observer.record("compress", (end := time.perf_counter()) - start_, len(payload))
+                start_ = end
+        encrypted_data = self.cipher.encrypt(payload, self.Key, self.encoding(codec))
+        if self.observer is not None:
+            self.observer.record("encrypt", time.perf_counter() - start_, len(encrypted_data))
+        return encrypted_data
+
+    def encoding(self, codec=None):
+        # compressed payloads are bytes of any value, mapped to text with latin-1 for onetimepad
+        return (codec or self.codec).encoding if self.compression is None else 'latin-1'
+
+    def decode(self, encrypted_data):
+        try:
+            if self.observer is None:
+                payload = self.cipher.decrypt(encrypted_data, self.Key, self.encoding())
+                if self.compression is not None:
+                    payload = self.compression.decompress(payload, self.dictionaries)
+                return self.codec.loads(payload)
+            start = time.perf_counter()
+            payload = self.cipher.decrypt(encrypted_data, self.Key, self.encoding())
+            self.observer.record("decrypt", (start_ := time.perf_counter()) - start, len(encrypted_data))
+            if self.compression is not None:
+                payload = self.compression.decompress(payload, self.dictionaries)
+                self.observer.record("decompress", (end := time.perf_counter()) - start_, len(payload))
+                start_ = end
+            data = self.codec.loads(payload)
+            self.observer.record("decode", time.perf_counter() - start_, len(payload))
+            return data
+        except Exception:
+            pass
+        return _decode(encrypted_data, self.Key, self.codec, self.cipher, self.compression, self.dictionaries)
+
+    @property
+    def bare_rows(self):
+        # rows.pickle stores the encrypted names as they are when they can be found again by encrypting
+        return self.cipher.deterministic
+
+    def row_record(self, row, key_=None):
+        # rows.pickle entry of a row, encrypted with the table's key or key_
+        name = self.cipher.encrypt(str(row).encode('utf-8'), key_ or self.Key, 'utf-8')
+        return name if self.bare_rows else {_hash_(str(row)): name}
+
+    def row_tombstone(self, row):
+        return {self.row_record(row) if self.bare_rows else _hash_(str(row)): None}
+
+    def row_name(self, name):
+        return self.cipher.decrypt(name, self.Key, 'utf-8').decode('utf-8')
+
+    def migrate(self, codec):
+        # re-encode the live rows of every _D_ file with another codec, one segment at a time
+        new = _codec(codec)
+
+        self.close_maps()
+        for d in self.segments():
+            file, file_backup = self.__files(d)
+            self.sides.switch(file=file, backup=file_backup,
+                              convert=lambda encrypted_data: self.encode(self.decode(encrypted_data), d, new))
+        self.codec = new
+
+    def close_maps(self):
+        # the files are replaced by compact and migrate, which a map prevents on Windows
+        if self.mapped is not None:
+            self.mapped.close()
+
+    def use_key(self, key_):
+        # after rekey, the rows and the compression dictionaries are encrypted with key_
+        self.Key = key_
+        if self.dictionaries is not None:
+            self.dictionaries.key = key_
+
+    def load_track(self):
+        # Track is read once per transaction, or once for many of them while no other process writes
+        if (data := self.wal.read(self.__Track)) is None:
+            with open(self.__Track, 'rb') as r:
+                data = r.read()
+            self.wal.remember(self.__Track, data)
+        return pickle.loads(data)
+
+    def dump_track(self, track_dict):
+        data = pickle.dumps(track_dict)
+        with nullcontext() if self.observer is None else self.observer.phase("write", len(data)):
+            if not self.wal.write(self.__Track, data, rewrite=True):
+                _write(self.__Track, data, mode="wb")
+
     def track(self, key, data=None, remove=False, sa=True):
 
-        with open(self.__Track, 'rb') as r:
-            track_dict = pickle.load(r)
+        track_dict = self.load_track()
         if key == "deleted_id":
             if remove:
                 data_ = track_dict[key]
@@ -219,7 +2329,7 @@ class _Insert(_Location):
             else:
                 data_ = track_dict[key]
                 data_.append(data)
-        elif key == "tree_track":  # track the D_tree rows, limit is 1k.
+        elif key == "tree_track":  # track the D_tree rows.
             if sa:  # add
                 data_ = int(track_dict[key]) + 1
             else:  # subtract
@@ -228,84 +2338,224 @@ class _Insert(_Location):
             data_ = data
 
         track_dict.__setitem__(key, data_)
-        os.chmod(self.__Track, stat.S_IWRITE)
-        with open(self.__Track, 'wb') as a:
-            pickle.dump(track_dict, a)
-        os.chmod(self.__Track, stat.S_IREAD)
+        self.dump_track(track_dict)
 
-    def insert(self, row, _data_, update=False, path=None):
+    def insert(self, row, _data_, update=False, path=None, columns=None):
         if not update:
-            with open(self.__Track, 'rb') as r:
-                track_dict = pickle.load(r)
-
-            d_state = True
-            if len(d_id := track_dict["deleted_id"]) != 0:
-                value = d_id[0].split(':')
-                counter = int(value[1]); d = int(value[0])
-                d_state = False
-            elif (s_id := track_dict["last_entry"]) != 0:
-                value = s_id.split(':')
-                counter = int(value[1]); d = int(value[0])
-            else:
-                d = 1; counter = 0; value = []
-
-            path = f"{d}:{counter}:"  # in case fb_state is not None
-            if d_state:
+            track_dict = self.load_track()
+            path = self.__allocate(track_dict)
+            self.dump_track(track_dict)
 
-                counter += 1
-                path = f"{d}:{counter}:"
-                self.track(key="last_entry", data=path)
+        file, file_backup = self.__files(d := path.split(":")[0])
 
-                if counter == 101:  # 100 rows limit in each _D_ file
-                    d += 1
-                    path = f"{d}:{1}:"
-                    self.track(key="last_entry", data=path)
+        # update=True appends the new version of the row (of the column groups of columns), the last record wins
+        self.sides.append(file=file, backup=file_backup, records=self.records(row, _data_, d, columns))
 
-                if d > 10:  # 10 _D_ files in Table folder => 1000 rows
-                    raise dbTableError(f"You have reached Table limit of 'one thousand rows' in {self.__db_name}.\n"
-                                       "Try to create another Table.")
+        return path
 
-            if not d_state:
-                self.track(key="deleted_id", data=":".join(value), remove=True)
+    def __allocate(self, track_dict):
+        """
+        Segment allocator, returns the "d:counter:" path of a new row and updates track_dict.
+        Paths of dropped rows are reused first, otherwise the last _D_ segment is filled
+        up to segment_size rows and the next segment is started on demand.
+        """
+        if len(d_id := track_dict["deleted_id"]) != 0:
+            return d_id.pop(0)
+
+        if (s_id := track_dict["last_entry"]) != 0:
+            value = s_id.split(':')
+            counter = int(value[1]); d = int(value[0])
         else:
-            d, _, _ = path.split(":")
+            d = 1; counter = 0
+
+        counter += 1
+        if counter > self.segment_size:
+            d += 1
+            counter = 1
+
+        track_dict["last_entry"] = (path := f"{d}:{counter}:")
+        return path
 
+    def __files(self, d):
         file = os.path.join(f"{self.__db}", f"_D_{d}.pickle")
         file_backup = os.path.join(f"{self.__db}", f"backup_D_{d}.pickle")
 
-        (data_dict := dict()).__setitem__(_hash_(str(row)), _encrypt(str(_data_), self.Key))
-
-        if not os.path.isfile(file):
+        if d not in self.sides.made and not os.path.isfile(file):
             with open(file, 'wb'):
-                os.chmod(file, stat.S_IREAD)
+                _read_only(file)
             with open(file_backup, 'wb'):
-                os.chmod(file_backup, stat.S_IREAD)
-
-        if update:
-            _F_B_switch(file=file,
-                        backup=file_backup,
-                        change=_hash_(str(row)))
-
-        _file_ = file_backup if _is_backup(file=file) else file
-
-        os.chmod(_file_, stat.S_IWRITE)
-        with open(_file_, "ab") as a:
-            pickle.dump(data_dict, a)
-        os.chmod(_file_, stat.S_IREAD)
-
-        return path
+                _read_only(file_backup)
+        self.sides.made.add(d)
+        return file, file_backup
+
+    def fetch(self, d, pass_ids):
+        # read the encrypted records of many rows from one _D_ file in a single pass, the last record wins
+        file, file_backup = self.__files(d)
+        side = self.sides.get(file=file, backup=file_backup)
+        if self.mapped is not None:
+            with nullcontext() if self.observer is None else self.observer.phase("read"):
+                return self.mapped.fetch(side, pass_ids)
+        records = dict()
+        with nullcontext() if self.observer is None else self.observer.phase("read", os.path.getsize(side)):
+            for data_dict in _records(side):
+                for key, value in data_dict.items():
+                    if key in pass_ids:
+                        records.__setitem__(key, value)
+        return {key: value for key, value in records.items() if value is not None}
+
+    def read(self, d, pass_id):
+        return self.fetch(d, {pass_id}).get(pass_id)
+
+    def decode_rows(self, records):
+        # {row: {column: data}} of encrypted records, the column groups of a row merged
+        return _merged(self.decode(encrypted_data) for encrypted_data in records)
+
+    def scan(self, d):
+        # the live encrypted records of one _D_ file {record key: record}, in storage order
+        file, file_backup = self.__files(d)
+        side = self.sides.get(file=file, backup=file_backup)
+        with nullcontext() if self.observer is None else self.observer.phase("read", os.path.getsize(side)):
+            return _live(_records(side))
+
+    def appended(self, d, offset=0):
+        """
+        The records of a _D_ file from offset [{record key: record}, ...] and (side, inode, offset) of
+        their end, so the next read (of Extract.compact and rekey) starts there.
+        """
+        records = []
+        with open(side := self.side(d), 'rb') as r, \
+                nullcontext() if self.observer is None else self.observer.phase(
+                    "read", os.fstat(r.fileno()).st_size - offset):
+            r.seek(offset)
+            while True:
+                try:
+                    records.append(pickle.load(r))
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                offset = r.tell()
+            return records, (side, os.fstat(r.fileno()).st_ino, offset)
+
+    def rows(self):
+        # (row, {column: data}) of the whole table in storage order, one _D_ file in memory at a time
+        with self.lock.shared(self.observer):
+            segments = self.segments()
+            # a new index file, the table was compacted and its rows moved
+            index = os.stat(self.__Index).st_ino
+        for d in segments:
+            # locked while a _D_ file is read, not while the caller consumes its rows
+            with self.lock.shared(self.observer):
+                if os.stat(self.__Index).st_ino != index:
+                    raise dbTableError(f"Table {self.__TableName} was compacted while its rows were iterated.")
+                records = self.scan(d)
+            if self.groups:
+                yield from self.decode_rows(records.values()).items()
+                continue
+            for encrypted_data in records.values():
+                yield from self.decode(encrypted_data).items()
+
+    def side(self, d):
+        # the side of the _D_ file to read
+        file, file_backup = self.__files(d)
+        return self.sides.get(file=file, backup=file_backup)
+
+    def stamp(self, d):
+        # changes with every write to the _D_ file, by this instance or another one
+        st = os.stat(_file_ := self.side(d))
+        return _file_, st.st_size, st.st_mtime_ns
+
+    def __append(self, d, data_dicts):
+        file, file_backup = self.__files(d)
+        self.sides.append(file=file, backup=file_backup, records=data_dicts)
+
+    def segments(self):
+        return sorted(int(file[3:-7]) for file in os.listdir(self.__db)
+                      if file.startswith("_D_") and file.endswith(".pickle"))
+
+    def insert_many(self, rows):
+        """
+        Insert new rows [(row, _data_), ...], each _D_ file and Track are written once.
+        returns the paths in the same order as rows.
+        """
+        track_dict = self.load_track()
+        paths = [self.__allocate(track_dict) for _ in rows]
+        track_dict["tree_track"] = int(track_dict["tree_track"]) + len(rows)
+
+        segments = dict()
+        for (row, _data_), path in zip(rows, paths):
+            segments.setdefault(d := path.split(':')[0], []).extend(self.records(row, _data_, d))
+
+        for d, data_dicts in segments.items():
+            self.__append(d, data_dicts)
+        self.dump_track(track_dict)
+        return paths
+
+    def update_many(self, rows):
+        # update rows that already exist [(row, _data_, path, columns), ...], one append per _D_ file
+        segments = dict()
+        for row, _data_, path, columns in rows:
+            segments.setdefault(d := path.split(':')[0], []).extend(self.records(row, _data_, d, columns))
+
+        for d, data_dicts in segments.items():
+            self.__append(d, data_dicts)
+
+
+class _Handle(_Location):
+    """
+    What Extract and Generate share, the lock, WAL and observer of their table, transactions,
+    create_index and the check of their key. The subclasses set default_key, _insert, _row_index, _indexes,
+    _xml and _table_name.
+    """
 
+    @property
+    def _lock(self):
+        return self._insert.lock
 
-class Extract(_Location):
+    @property
+    def _wal(self):
+        return self._insert.wal
 
-    def __init__(self, db_path=current_directory, db_name="_dbTables_", table_name=None, decrypt_key=default_key):
+    @property
+    def _observer(self):
+        return self._insert.observer
+
+    @contextmanager
+    def transaction(self, sync=True):
+        """
+        Groups writes, they are all applied or none of them is (an exception rolls them back),
+        other readers and writers wait for the end of the transaction.
+        The changes are logged with one fsync on commit, sync=False skips it (atomic but not durable).
+        """
+        with nullcontext() if self._observer is None else self._observer.operation("transaction"), \
+                self._lock.exclusive(self._observer), self._wal.transaction(sync=sync, observer=self._observer):
+            self._check_key()
+            yield self
+
+    def _check_key(self):
+        # under the table's lock, another instance may have rekeyed the table since this one was opened
+        if self._xml.access()[1] != _hash_(self.default_key):
+            raise KeyError(f"Access denied, the key {self.default_key} is not the table {self._table_name}'s key.")
+
+    @_exclusive
+    def create_index(self, column=None):
+        # index the column's values, so Extract.find_by doesn't scan the table
+        if column not in (ts_column := self._xml.access()[0]):
+            raise dbTableError(f"{column} does not exist in table {self._table_name}'s columns"
+                               f"\n The available columns:  {ts_column}")
+        self._row_index.refresh()
+        self._indexes.create(str(column), ((_hash_(str(row)), cells) for row, cells in self._insert.rows()))
+
+
+class Extract(_Handle):
+
+    def __init__(self, db_path=current_directory, db_name="_dbTables_", table_name=None, decrypt_key=default_key,
+                 cache_size=0, observer=None, mapped_segments=None):
         super().__init__(db_path, db_name)
 
         self.default_key = decrypt_key
-        self.__TableName = table_name
+        self._table_name = table_name
         self.__db_path = db_path
         self.__db_name = db_name
-        self.__Table_location = os.path.join(f"{self.path}", f"{_hash_(self.__TableName)}")
+        self.__Table_location = os.path.join(f"{self.path}", f"{_hash_(self._table_name)}")
         self.__db = os.path.join(f"{self.__Table_location}", f"_Database_")
         self.__MetaData = os.path.join(f"{self.__Table_location}", f"_MetaData_")
         self.__XML_ts = os.path.join(f"{self.__MetaData}", "T_state.xml")
@@ -314,18 +2564,84 @@ class Extract(_Location):
         self.__row_collections = os.path.join(f"{self.__MetaData}", "rows.pickle")
         self.__row_collections_backup = os.path.join(f"{self.__MetaData}", f"rows_backup.pickle")
         self.__Track = os.path.join(f"{self.__MetaData}", "Track.pickle")
-        self.__insert = _Insert(db_path=self.__db_path, db_name=self.__db_name, table_name=self.__TableName,
-                                encrypt_key=self.default_key)
+        self.__Index = os.path.join(f"{self.__MetaData}", "Index.pickle")
+        # one compact or rekey of the table at a time
+        self.__rebuilding = _per_table(_TableLock, os.path.join(f"{self.__MetaData}", "Rebuild.lock"))
 
+        # a compact or rekey interrupted after its commit is finished first, T_state.xml may be one of its files
+        _finish_rebuild(self.__Table_location)
         try:
-            self.__ts_column = _XML(self.__XML_ts).access()[0]
-            self.__hashed_key = _XML(self.__XML_ts).access()[1]
+            self._xml = _XML(self.__XML_ts)
+            self.__ts_column, self.__hashed_key = self._xml.access()
         except Exception:
-            raise dbTableError(f"No such Table {self.__TableName}")
+            raise dbTableError(f"No such Table {self._table_name}")
 
         if self.__hashed_key != _hash_(self.default_key):
             raise KeyError(f"Access denied, the decryption key {self.default_key} "
-                           f"is not the table {self.__TableName}'s decryption key.")
+                           f"is not the table {self._table_name}'s decryption key.")
+
+        if mapped_segments is not None and (not isinstance(mapped_segments, int) or mapped_segments < 0):
+            raise TypeError("Mapped segments must be a positive int or 0, use the key argument mapped_segments= .")
+        self._insert = _table_insert(self._xml, db_path=self.__db_path, db_name=self.__db_name,
+                                      table_name=self._table_name, encrypt_key=self.default_key, observer=observer,
+                                      mapped_segments=mapped_segments)
+
+        # hashed row => path, loaded once per instance
+        self._row_index = _Index(self.__Index, self.__D_Tree, self.__D_Tree_backup, sides=self._insert.sides,
+                                  wal=self._insert.wal, observer=observer)
+
+        # secondary indexes on column values
+        self._indexes = _ColumnIndexes(self.__MetaData, self.default_key, wal=self._insert.wal, observer=observer)
+
+        # decrypted rows LRU cache, disabled by default
+        if not isinstance(cache_size, int) or cache_size < 0:
+            raise TypeError("Cache size must be a positive int or 0, use the key argument cache_size= .")
+        self.__cache = _RowCache(cache_size) if cache_size else None
+
+    def __decoded(self, d, pass_id, columns=None):
+        """
+        The decrypted row {row: {column: data}}, with columns only the cells of their column groups,
+        from the row cache when it's enabled
+        """
+        keys = self._insert.keys(pass_id, columns)
+        records = self.__records(d, keys)
+        if len(keys) == 1:
+            return records.get(keys[0])
+        return _merged(records[key] for key in keys if key in records) or None
+
+    def __records(self, d, keys):
+        """
+        The decrypted records {record key: {row: {column: data}}} of keys in the _D_ file d, from the row
+        cache when it's enabled, the others are read in one pass and decrypted
+        """
+        records = dict()
+        if self.__cache is not None:
+            stamp = self._insert.stamp(d)
+            for key in keys:
+                if (data_dict := self.__cache.get(key, stamp)) is not None:
+                    records[key] = data_dict
+
+        if len(records) < len(keys):
+            for key, encrypted_data in self._insert.fetch(d, set(keys).difference(records)).items():
+                records[key] = data_dict = self._insert.decode(encrypted_data)
+                if self.__cache is not None:
+                    self.__cache.put(key, stamp, data_dict)
+        return records
+
+    def __invalidate(self, row):
+        if self.__cache is not None:
+            for key in self._insert.keys(_hash_(str(row))):
+                self.__cache.discard(key)
+
+
+    @property
+    def cache_info(self):
+        # hits, misses and size of the row cache
+        return None if self.__cache is None else self.__cache.info()
+
+    def cache_clear(self):
+        if self.__cache is not None:
+            self.__cache.clear()
 
     def __find(self, row=None, column=None, call=True):
         # search for data in database
@@ -333,7 +2649,7 @@ class Extract(_Location):
             raise dbTableError("Row should not be empty, use the key argument row=.")
 
         if column not in self.__ts_column and column is not None:
-            raise dbTableError(f"{column} does not exist in table {self.__TableName}'s columns"
+            raise dbTableError(f"{column} does not exist in table {self._table_name}'s columns"
                                f"\n The available columns:  {self.__ts_column}")
 
         if isinstance(column, str) or isinstance(column, float) or isinstance(column, int) or column is None:
@@ -345,31 +2661,15 @@ class Extract(_Location):
         pass_id = _hash_(str(row))
         data_dict = False
 
-        with open(self.__D_Tree_backup if _is_backup(file=self.__D_Tree) else self.__D_Tree, "rb") as r:
-            try:
-                while dictionary := pickle.load(r):
-                    if dictionary.__contains__(pass_id):
-                        dictionary = dictionary.__getitem__(pass_id)
-                        value = dictionary.split(':')
-                        break
-            except EOFError:
-                pass
+        if (dictionary := self._row_index.get(pass_id)) is not None:
+            value = dictionary.split(':')
 
         if value:
-            data_path = os.path.join(f"{self.__db}", f"_D_{value[0]}.pickle")
-            backup_data_path = os.path.join(f"{self.__db}", f"backup_D_{value[0]}.pickle")
-
-            with open(backup_data_path if _is_backup(file=data_path) else data_path, "rb") as R:
-                try:
-                    while data_dict := pickle.load(R):
-                        if data_dict.__contains__(pass_id):
-                            data_dict = data_dict.__getitem__(pass_id)
-                            break
-                except EOFError:
-                    pass
+            if (data_dict := self.__decoded(value[0], pass_id, None if column is None else (column,))) is None:
+                data_dict = False
+                value = []
 
             if data_dict:
-                data_dict = eval(_decrypt(data_dict, self.default_key))
                 if column is None:
                     output_data = data_dict[f"{str(row)}"]
                 else:
@@ -386,20 +2686,51 @@ class Extract(_Location):
 
         return output_data, bool(value), (data_dict if value else None), (dictionary if value else None)
 
+    @_shared
     def find(self, row=None, column=None):
         # find data cell
         return self.__find(row, column)[0]
 
+    @_shared
+    def find_many(self, rows, columns=None):
+        """
+        Find many rows at once, {row: {column: data}} of the rows that exist, columns limits the columns.
+        The rows are grouped by _D_ file, each file is read once and only the found rows are decrypted.
+        """
+        columns, _ = self.__scan_arguments(columns, None)
+        names = {_hash_(str(row)): str(row) for row in rows}
+
+        segments = dict()
+        for pass_id, path in self._row_index.get_many(names).items():
+            segments.setdefault(path.split(':')[0], []).append(pass_id)
+
+        found = dict()
+        for d, pass_ids in segments.items():
+            # only the column groups of columns are read
+            found.update(self.__records(d, [key for pass_id in pass_ids
+                                            for key in self._insert.keys(pass_id, columns)]))
+
+        result = dict()
+        for pass_id, row in names.items():
+            if (cells := _merged(found[key] for key in self._insert.keys(pass_id, columns)
+                                 if key in found).get(row)) is not None:
+                result[row] = cells if columns is None else \
+                    {str(column): cells[str(column)] for column in columns if str(column) in cells}
+        return result
+
+    @_shared
     def row_stringify(self, row=None, indent=2, sort_keys=False):
         if self.check(row):
             return json.dumps(self.__find(row)[0], indent=indent, sort_keys=sort_keys)
         else:
             raise NotFound(f"Row {row} does not exist.")
 
+    @_shared
     def check(self, row, column=None):
         # check is data exist
         return self.__find(row, column, call=False)[1]
 
+    @_writes
     def remove(self, row=None, column=None):
         # remove column's data cell
         if column is None:
@@ -407,31 +2738,218 @@ class Extract(_Location):
 
         if (check_row_state := self.__find(row, column))[1]:
             col_dict = check_row_state[2]
+            old_cells = dict(col_dict[str(row)])
             col_dict[str(row)].__delitem__(str(column))
-            self.__insert.insert(_data_=col_dict, row=row, update=True, path=check_row_state[3])
+            self.__invalidate(row)
+            # only the column's group is written again
+            self._insert.insert(_data_=col_dict, row=row, update=True, path=check_row_state[3],
+                                 columns=(column,))
+            self._indexes.change([(_hash_(str(row)), old_cells, col_dict[str(row)])])
         else:
             raise NotFound(f"Row {row} or the column {column} does not exist.")
 
+    @_shared
     def __len__(self):
         # return the number of rows inside a table
-        with open(self.__Track, 'rb') as r:
-            try:
-                counter = int(pickle.load(r)["tree_track"])
-            except EOFError:
-                counter = 0
+        try:
+            counter = int(self._insert.load_track()["tree_track"])
+        except EOFError:
+            counter = 0
         return counter
 
     @property
+    @_shared
     def fetchall_rows(self):
         # returns all table's rows in row_collections file
-        fb_state = _is_backup(file=self.__row_collections)
-        rows = []
-        with open(self.__row_collections_backup if fb_state else self.__row_collections, "rb") as read:
-            while True:
-                try:
-                    rows.append(_decrypt(pickle.load(read), self.default_key))
-                except EOFError:
-                    break
+        self._row_index.refresh()
+        rows = _live(_records(self._insert.sides.get(file=self.__row_collections,
+                                                      backup=self.__row_collections_backup)))
+        return [self._insert.row_name(name) for name in rows.values()]
+
+    def iter_rows(self):
+        """
+        Yield the table's rows in storage order (the order of fetchall_rows) without making the list,
+        the names are read from rows.pickle and decrypted a chunk of segment_size records at a time.
+        """
+        rows = self.__iter_rows()
+        return rows if self._observer is None else self._observer.iterate("iter_rows", rows)
+
+    def __iter_rows(self):
+        # rows.pickle is read twice, first for its tombstones, a name is yielded if no tombstone of
+        # the row follows it, so only the dropped rows are kept in memory
+        with self._lock.shared(self._observer):
+            self._row_index.refresh()
+            index = os.stat(self.__Index).st_ino
+            file = self._insert.sides.get(file=self.__row_collections, backup=self.__row_collections_backup)
+            dropped = dict()
+            with open(file, 'rb') as r:
+                for record in _records(r):
+                    if isinstance(record, dict) and None in record.values():
+                        key = next(iter(record))
+                        dropped[key] = dropped.get(key, 0) + 1
+                end = r.tell()
+
+        offset = 0
+        while offset < end:
+            with self._lock.shared(self._observer):
+                if os.stat(self.__Index).st_ino != index:
+                    raise dbTableError(f"Table {self._table_name} was compacted while its rows were iterated.")
+                names = []
+                with open(file, 'rb') as r:
+                    r.seek(offset)
+                    for record in _records(r):
+                        if isinstance(record, dict):
+                            key, name = next(iter(record.items()))
+                        else:
+                            key = name = record
+                        if name is None:
+                            dropped[key] -= 1
+                        elif not dropped.get(key):
+                            names.append(name)
+                        if (offset := r.tell()) >= end or len(names) == self._insert.segment_size:
+                            break
+                    else:
+                        offset = end
+            for name in names:
+                yield self._insert.row_name(name)
+
+    def iter_items(self, columns=None):
+        """
+        Yield (row, {column: data}) of the whole table in storage order, one _D_ file in memory at a time
+        and every row decrypted when it's reached, columns limits the returned columns.
+        """
+        return self.select(columns=columns)
+
+    @_observed_by
+    def export_csv(self, file, columns=None):
+        """
+        Write the table to a CSV file (a path or a file open in text mode) in storage order, one _D_ file
+        in memory at a time: a header row, column-1, ... and a line per row, a missing cell is an empty field.
+        columns limits the columns. Returns the number of rows.
+        """
+        columns, _ = self.__scan_arguments(columns, None)
+        columns = [str(column) for column in (columns or self.__ts_column)]
+        count = 0
+        with _text_file(file, "w") as w:
+            writer = csv.writer(w)
+            writer.writerow(["row", *columns])
+            for row, cells in self.__select(None, None, None):
+                writer.writerow([row, *(cells.get(column, "") for column in columns)])
+                count += 1
+        return count
+
+    @_observed_by
+    def export_jsonl(self, file, columns=None):
+        """
+        Write the table to a JSON Lines file (a path or a file open in text mode) in storage order,
+        a line {"row": row, "cells": {column: data}} per row, data that isn't JSON is written as str.
+        columns limits the columns. Returns the number of rows.
+        """
+        columns, _ = self.__scan_arguments(columns, None)
+        count = 0
+        with _text_file(file, "w") as w:
+            for row, cells in self.__select(columns, None, None):
+                w.write(json.dumps({"row": row, "cells": cells}, default=str) + "\n")
+                count += 1
+        return count
+
+    def select(self, columns=None, where=None, limit=None):
+        """
+        Scan the whole table once, one _D_ file at a time, and yield (row, {column: data}) lazily.
+        where is a callable that takes the row's {column: data} and returns True to keep it,
+        or a dict of {column: data} the row must be equal to.
+        columns limits the returned columns, limit the number of rows.
+        """
+        columns, where = self.__scan_arguments(columns, where)
+        if isinstance(where, dict):
+            where = partial(_matches, where)
+
+        if self._observer is not None:
+            return self._observer.iterate("select", self.__select(columns, where, limit))
+        return self.__select(columns, where, limit)
+
+    def __scan_arguments(self, columns, where):
+        # columns as a tuple and where as a callable or a dict of {str(column): data}
+        if columns is not None:
+            # a list or a generator once as a tuple, the check and the selection use the same columns
+            columns = (columns,) if isinstance(columns, (str, int, float)) else tuple(columns)
+        for column in (columns or ()) + (tuple(where) if isinstance(where, dict) else ()):
+            if column not in self.__ts_column:
+                raise dbTableError(f"{column} does not exist in table {self._table_name}'s columns"
+                                   f"\n The available columns:  {self.__ts_column}")
+
+        if isinstance(where, dict):
+            where = {str(column): data for column, data in where.items()}
+        elif where is not None and not callable(where):
+            raise TypeError("where must be a callable or a dict of {column: data}.")
+        return columns, where
+
+    @_shared
+    def scan(self, function=None, where=None, columns=None, reduce=None, processes=None):
+        """
+        Scan the whole table with a pool of processes, each _D_ file is decrypted and decoded by a worker
+        that keeps the rows matching where (as in select) and returns function(row, {column: data}) of them,
+        or (row, {column: data}) without function.
+        Returns the results of all the files in storage order, or with reduce (a function of two results)
+        the results reduced to one (None without rows).
+        function, where and reduce must be picklable (functions of a module, not lambdas).
+        processes defaults to the number of CPUs, processes=1 scans in this process.
+        """
+        columns, where = self.__scan_arguments(columns, where)
+        self._row_index.refresh()
+        # the workers read the files under the lock of this process
+        files = [self._insert.side(d) for d in self._insert.segments()]
+        compression = self._insert.compression
+        arguments = (self.default_key, self._insert.codec.name, self._insert.cipher.name,
+                     None if compression is None else compression.name,
+                     None if self._insert.dictionaries is None else self._insert.dictionaries.all(),
+                     where, columns, function, reduce)
+
+        if processes == 1 or len(files) <= 1:
+            results = [_scan_segment(file, *arguments) for file in files]
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes or os.cpu_count() or 1, len(files))) as pool:
+                results = list(pool.map(_scan_segment, files, *([argument] * len(files) for argument in arguments)))
+
+        if reduce is None:
+            return [result for results_ in results for result in results_]
+        results = [result for found, result in results if found]
+        return _reduce(reduce, results) if results else None
+
+    def __select(self, columns, where, limit):
+        if limit is not None and limit <= 0:
+            return
+
+        # the _D_ files may have switched sides, compact or migrate of another instance
+        self._row_index.refresh()
+        count = 0
+        for row, cells in self._insert.rows():
+            if where is not None and not where(cells):
+                continue
+            if columns is not None:
+                cells = {str(column): cells[str(column)] for column in columns if str(column) in cells}
+            yield row, cells
+            count += 1
+            if count == limit:
+                return
+
+    @_shared
+    def find_by(self, column=None, value=None):
+        """
+        Rows that have value in an indexed column, {row: {column: data}}
+        the cost depends on the number of matches, not on the size of the table.
+        """
+        segments = dict()
+        for pass_id in self._indexes.get(str(column), value):
+            if (path := self._row_index.get(pass_id)) is not None:
+                segments.setdefault(path.split(':')[0], set()).update(self._insert.keys(pass_id))
+
+        rows = dict()
+        for d, keys in segments.items():
+            for row, cells in self._insert.decode_rows(self._insert.fetch(d, keys).values()).items():
+                # the index keeps hashes, check the value itself
+                if str(column) in cells and cells[str(column)] == value:
+                    rows.__setitem__(row, cells)
         return rows
 
     @property
@@ -439,6 +2957,7 @@ class Extract(_Location):
         # returns all columns of a table from XML file
         return [col for col in self.__ts_column]
 
+    @_writes
     def update(self, data=None, row=None, column=None):
         # updating data cell using row and columns
         if data is None:
@@ -449,45 +2968,192 @@ class Extract(_Location):
 
         if (check_row_state := self.__find(row, column))[1]:
             col_dict = check_row_state[2]
+            old_cells = dict(col_dict[str(row)])
             col_dict[str(row)].__setitem__(str(column), data)
-            self.__insert.insert(_data_=col_dict, row=row, update=True, path=check_row_state[3])
+            self.__invalidate(row)
+            # only the column's group is written again
+            self._insert.insert(_data_=col_dict, row=row, update=True, path=check_row_state[3],
+                                 columns=(column,))
+            self._indexes.change([(_hash_(str(row)), old_cells, col_dict[str(row)])])
         else:
             raise NotFound(f"Row {row} or the column {column} does not exist.")
 
+    @_writes
     def drop_row(self, row=None):
         # removing rows
-        check = False
         pass_row = _hash_(str(row))
-        with open(self.__D_Tree_backup if _is_backup(file=self.__D_Tree) else self.__D_Tree, "rb") as read:
-            try:
-                while dictionary := pickle.load(read):
-                    if dictionary.__contains__(pass_row):
-                        path_id = dictionary.__getitem__(pass_row)
-                        check = True
-                        break
-            except EOFError:
-                pass
 
-        if check:
-            # remove the row from D_tree file
-            _F_B_switch(file=self.__D_Tree,
-                        backup=self.__D_Tree_backup,
-                        change=pass_row)
+        if (path_id := self._row_index.get(pass_row)) is not None:
+            if self._indexes:
+                # the dropped values leave the secondary indexes
+                old_cells = (self.__decoded(path_id.split(':')[0], pass_row) or {}).get(str(row))
+                self._indexes.change([(pass_row, old_cells, None)])
+
+            # tombstone the row in D_tree file and the row index
+            self._insert.sides.append(file=self.__D_Tree, backup=self.__D_Tree_backup, records=[{pass_row: None}])
+            self._row_index.discard(pass_row)
+            self.__invalidate(row)
 
             # remove the row from database
-            self.__insert.delete(path_id, row=row)
+            self._insert.delete(path_id, row=row)
 
-            self.__insert.track(key="tree_track", sa=False)
+            self._insert.track(key="tree_track", sa=False)
 
-            # remove the row from row_collections file
-            _F_B_switch(file=self.__row_collections,
-                        backup=self.__row_collections_backup,
-                        change=_encrypt(str(row), self.default_key))
+            # tombstone the row in row_collections file
+            self._insert.sides.append(file=self.__row_collections, backup=self.__row_collections_backup,
+                                       records=[self._insert.row_tombstone(row)])
         else:
             raise NotFound(f"Row {row} does not exist.")
 
+    @_exclusive
+    def migrate(self, codec=default_codec):
+        """
+        Re-encode the table's rows with another codec (tables made by dbTable 1.6 use "repr"),
+        the _D_ files are compacted on the way. Other instances of the table should be reopened.
+        """
+        self._insert.migrate(codec)
+        _XML(self.__XML_ts).set("codec", codec)
+        self.cache_clear()
+        # a new index file tells the other instances that the _D_ files switched sides
+        self._row_index.compact()
+
+    @_observed_by
+    def compact(self):
+        """
+        Updates and drops are appended to the table's files, compact writes the live rows again
+        in new files, without the overwritten and dropped records and the paths left by the dropped rows.
+        Reads and writes go on while the rows are copied, the table is locked to put the new files in place.
+        """
+        self.__rebuild(self.default_key)
+
+    @_observed_by
+    def rekey(self, old_key=None, new_key=None):
+        """
+        Encrypt the table with new_key instead of old_key, its rows are copied as by compact.
+        Other instances of the table should be reopened with new_key.
+        """
+        if old_key is None or _hash_(old_key) != self._xml.access()[1]:
+            raise KeyError(f"Access denied, the key {old_key} is not the table {self._table_name}'s key.")
+        if not isinstance(new_key, str) or not new_key:
+            raise TypeError("The new key must be a str, use the key argument new_key= .")
+        self.__rebuild(new_key)
+
+    def __rebuild(self, key_):
+        """
+        The live rows are copied one _D_ file at a time under the shared lock (_Rebuild), then the rows
+        written meanwhile are copied again in a few rounds, the last one and the swap of the files under
+        the exclusive lock. A change that isn't an append (migrate, create_index) has the rows copied
+        again under the exclusive lock.
+        """
+        # a transaction would hold the table's lock while waiting for another compact
+        self._wal.outside()
+        with self.__rebuilding.exclusive(self._observer):
+            with self._lock.exclusive(self._observer):
+                self._wal.checkpoint()
+                _finish_rebuild(self.__Table_location)
+                self._check_key()
+                state = self.__state()
+            rebuild = self.__stage(key_)
+            # bounded, a stream of writes can't hold the rebuild back
+            for _ in range(3):
+                if not self.__catch_up(rebuild, state):
+                    break
+
+            with self._lock.exclusive(self._observer):
+                if self.__catch_up(rebuild, state) is None:
+                    rebuild.abort()
+                    rebuild = self.__stage(key_)
+                self._insert.close_maps()
+                # the log is emptied before the commit, it can't be written again over the new files
+                self._wal.checkpoint()
+                rebuild.commit()
+                _finish_rebuild(self.__Table_location)
+                self._insert.sides.clear()
+                # a new log, the other instances read Track again
+                self._wal.renew()
+                if key_ != self.default_key:
+                    self.__use_key(key_)
+                self.cache_clear()
+
+    def __state(self):
+        # changes with the writes that aren't appends to the _D_ files, T_state.xml, the indexed columns
+        # and the compression dictionaries, or a new row index
+        state = [os.stat(self.__Index).st_ino]
+        for name in ("T_state.xml", "Indexes.pickle", "Dictionaries.pickle"):
+            try:
+                st = os.stat(os.path.join(f"{self.__MetaData}", name))
+                state.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                state.append(None)
+        return state
+
+    def __stage(self, key_):
+        # the live rows of the table written in _Rebuild_ with key_, each _D_ file is read under the shared lock
+        with self._lock.shared(self._observer):
+            self._indexes.refresh()
+            rebuild = _Rebuild(self.__Table_location, self._insert, key_, indexed=tuple(self._indexes.columns))
+            segments = self._insert.segments()
+        for d in segments:
+            with self._lock.shared(self._observer):
+                records = dict()
+                appended, rebuild.sources[d] = self._insert.appended(d)
+                for key, encrypted_data in _live(appended).items():
+                    records.setdefault(key.partition(":")[0], []).append(encrypted_data)
+                paths = self._row_index.get_many(records)
+            # decrypted out of the lock, the records of a row outside the _D_ file of its path are dead
+            for pass_id, path in paths.items():
+                if path.split(':')[0] == str(d):
+                    for row, cells in self._insert.decode_rows(records[pass_id]).items():
+                        rebuild.add(row, cells)
+        rebuild.close()
+
+        if key_ != self.default_key:
+            shutil.copyfile(self.__XML_ts, xml_ts := os.path.join(f"{rebuild.meta_data}", "T_state.xml"))
+            _XML(xml_ts).set("hashed_key", _hash_(key_))
+        return rebuild
+
+    def __catch_up(self, rebuild, state):
+        """
+        Copy again the rows written since rebuild read their _D_ files, only the records appended since
+        are read. The number of rows, or None when the table changed in another way and is read again.
+        """
+        with self._lock.shared(self._observer):
+            if self.__state() != state or not set(rebuild.sources) <= set(segments := self._insert.segments()):
+                return None
+            appended = dict()
+            for d in segments:
+                st = os.stat(side := self._insert.side(d))
+                source, inode, offset = rebuild.sources.get(d, (side, st.st_ino, 0))
+                if (source, inode) != (side, st.st_ino) or st.st_size < offset:
+                    # switched or cut back
+                    return None
+                if st.st_size > offset:
+                    appended[d], rebuild.sources[d] = self._insert.appended(d, offset)
+            changed = {key.partition(":")[0] for records in appended.values() for record in records for key in record}
+            paths = self._row_index.get_many(changed)
+
+        # decrypted out of the lock, a row without records in the _D_ file of its path didn't change there
+        for pass_id in changed.difference(paths):
+            rebuild.drop(pass_id)
+        for d, records in appended.items():
+            rows = dict()
+            for key, encrypted_data in _live(records).items():
+                if (path := paths.get(pass_id := key.partition(":")[0])) is not None and path.split(':')[0] == str(d):
+                    rows.setdefault(pass_id, []).append((key, self._insert.decode(encrypted_data)))
+            for records_ in rows.values():
+                rebuild.update(next(iter(records_[0][1])), records_)
+        return len(changed)
+
+    def __use_key(self, key_):
+        self.default_key = key_
+        self.__hashed_key = _hash_(key_)
+        self._insert.use_key(key_)
+        self._indexes = _ColumnIndexes(self.__MetaData, key_, wal=self._wal, observer=self._observer)
+
+    @_exclusive
     def drop_table(self):
         # remove all files and folders that makes a table
+        self._insert.close_maps()
         for _, d, _ in os.walk(path := self.__Table_location):
             for folder in d:
                 for _, _, f in os.walk(folder_ := os.path.join(f"{path}", f"{folder}")):
@@ -499,34 +3165,48 @@ class Extract(_Location):
             shutil.rmtree(path)
         except OSError:
             pass
+        # a table made again with the same name gets a new Lock file
+        self._lock.close()
+        self._wal.close()
+        _catalog(self.path).drop(self._table_name)
 
     @property
     def tables(self):
-        # search through all XML files for table's names
-        files = []
-        # r=root, d=directories, f=files
-        for r, d, f in os.walk(self.path):
-            for file in f:
-                if '.xml' in file:
-                    files.append(os.path.join(r, file))
-        table_names = []
-        for path in files:
-            table_names.append(_XML(path).access(path=True))
-        return table_names
+        # table's names, from the database's catalog
+        return _catalog(self.path).names()
+
+    @property
+    def catalog(self):
+        # {table name: {"folder", "columns", "rows"}}, the rows are counted by each table's Track.pickle
+        catalog = dict()
+        for name, (folder, columns) in _catalog(self.path).items():
+            try:
+                with open(os.path.join(f"{self.path}", f"{folder}", "_MetaData_", "Track.pickle"), 'rb') as r:
+                    rows = int(pickle.load(r)["tree_track"])
+            except (OSError, EOFError, pickle.UnpicklingError):
+                rows = None
+            catalog[name] = {"folder": folder, "columns": columns, "rows": rows}
+        return catalog
 
+    def rebuild_catalog(self):
+        # the catalog made again from the tables' folders, after they were copied or removed by hand
+        _catalog(self.path).rebuild()
 
-class Generate(_Location):
+
+class Generate(_Handle):
 
     def __init__(self, db_path=current_directory, db_name="_dbTables_",
-                 table_name=None, encrypt_key=default_key, columns=None):
+                 table_name=None, encrypt_key=default_key, columns=None, segment_size=default_segment_size,
+                 codec=default_codec, cipher=default_cipher, observer=None, column_groups=None, compression=None,
+                 compression_dictionary=False):
         super().__init__(db_path, db_name)
 
         self.default_key = encrypt_key
         self.db_name = db_name
         self.db_path = db_path
-        self.__TableName = table_name
+        self._table_name = table_name
         self.__Column = (columns,) if isinstance(columns, str) else columns
-        self.__Table_location = os.path.join(f"{self.path}", f"{_hash_(self.__TableName)}")
+        self.__Table_location = os.path.join(f"{self.path}", f"{_hash_(self._table_name)}")
         self.__db = os.path.join(f"{self.__Table_location}", "_Database_")
         self.__MetaData = os.path.join(f"{self.__Table_location}", "_MetaData_")
         self.__XML_ts = os.path.join(f"{self.__MetaData}", f"T_state.xml")
@@ -535,15 +3215,35 @@ class Generate(_Location):
         self.__row_collections = os.path.join(f"{self.__MetaData}", f"rows.pickle")
         self.__row_collections_backup = os.path.join(f"{self.__MetaData}", f"rows_backup.pickle")
         self.__Track = os.path.join(f"{self.__MetaData}", "Track.pickle")
-        self.__insert = _Insert(db_path=self.db_path, db_name=self.db_name, table_name=self.__TableName,
-                                encrypt_key=self.default_key)
+        self.__Index = os.path.join(f"{self.__MetaData}", "Index.pickle")
 
         if self.__Column is None:
             raise TypeError("Column should not be None, use the key argument columns= .")
 
-        if self.__TableName is None:
+        if self._table_name is None:
             raise TypeError("Table without a name, use the key argument table_name= .")
 
+        if not isinstance(segment_size, int) or segment_size < 1:
+            raise TypeError("Segment size must be a positive int, use the key argument segment_size= .")
+
+        _codec(codec)
+        _cipher(cipher)
+        if compression_dictionary and not getattr(_compression(compression), "dictionary", False):
+            raise TypeError("A compression dictionary needs the zlib compression, use the key argument compression= .")
+
+        # column groups are stored and encrypted apart, the other columns make group 0
+        column_groups = tuple(tuple(str(column) for column in ((group,) if isinstance(group, (str, int)) else group))
+                              for group in column_groups or ())
+        grouped = [column for group in column_groups for column in group]
+        if len(grouped) != len(set(grouped)) or not all(column_groups):
+            raise TypeError("Column groups must be non-empty and not share columns, use the key argument "
+                            "column_groups= .")
+        for column in grouped:
+            if column not in (columns_ := [str(column_) for column_ in self.__Column]):
+                raise dbTableError(f"{column} does not exist in table {self._table_name}'s columns"
+                                   f"\n available columns:  {columns_}")
+
+        _finish_rebuild(self.__Table_location)
         if not os.path.isdir(self.__Table_location):
             # make all files and folders for table's metadata and database
             os.mkdir(self.__Table_location)
@@ -553,15 +3253,17 @@ class Generate(_Location):
             with open(self.__Track, 'wb') as w:
                 track_dict = {"last_entry": 0, "deleted_id": [], "tree_track": 0}
                 pickle.dump(track_dict, w)
-                os.chmod(self.__Track, stat.S_IREAD)
+                _read_only(self.__Track)
             with open(self.__D_Tree_backup, 'wb'):
-                os.chmod(self.__D_Tree_backup, stat.S_IREAD)
+                _read_only(self.__D_Tree_backup)
             with open(self.__D_Tree, "wb"):
-                os.chmod(self.__D_Tree, stat.S_IREAD)
+                _read_only(self.__D_Tree)
             with open(self.__row_collections, "wb"):
-                os.chmod(self.__row_collections, stat.S_IREAD)
+                _read_only(self.__row_collections)
             with open(self.__row_collections_backup, "wb"):
-                os.chmod(self.__row_collections_backup, stat.S_IREAD)
+                _read_only(self.__row_collections_backup)
+            with open(self.__Index, "wb"):
+                _read_only(self.__Index)
 
             """writing XML file for table's info"""
             root = ET.Element("Meta-Data")
@@ -569,45 +3271,56 @@ class Generate(_Location):
             tree.write(self.__XML_ts)
             tree = ET.parse(self.__XML_ts)
             root = tree.getroot()
-            doc = ET.SubElement(root, "Table", attrib={"Name": f"{self.__TableName}"})
+            doc = ET.SubElement(root, "Table", attrib={"Name": f"{self._table_name}"})
             ET.SubElement(doc, "columns").text = f"{self.__Column}"
-            ET.SubElement(doc, "Name").text = f"{self.__TableName}"
+            ET.SubElement(doc, "Name").text = f"{self._table_name}"
             ET.SubElement(doc, "hashed_key").text = f"{_hash_(self.default_key)}"
+            ET.SubElement(doc, "segment_size").text = f"{segment_size}"
+            ET.SubElement(doc, "codec").text = f"{codec}"
+            ET.SubElement(doc, "cipher").text = f"{cipher}"
+            if column_groups:
+                ET.SubElement(doc, "column_groups").text = f"{column_groups}"
+            if compression is not None:
+                ET.SubElement(doc, "compression").text = f"{compression}"
+                ET.SubElement(doc, "compression_dictionary").text = f"{bool(compression_dictionary)}"
             tree.write(self.__XML_ts)
-            os.chmod(self.__XML_ts, stat.S_IREAD)
+            _read_only(self.__XML_ts)
+
+        # the table's segment size, column groups and compression win over the arguments for tables that already exist
+        self._xml = _XML(self.__XML_ts)
+
+        # the key is checked first, a wrong one doesn't touch the catalog
+        ts_column = self.__table_state()
+        # listed in the database's catalog, tables made before the catalog are added on the way
+        _catalog(self.path).add(self._table_name, _hash_(self._table_name), ts_column)
+        self._insert = _table_insert(self._xml, db_path=self.db_path, db_name=self.db_name,
+                                      table_name=self._table_name, encrypt_key=self.default_key, observer=observer)
+
+        # hashed row => path, loaded once per instance
+        self._row_index = _Index(self.__Index, self.__D_Tree, self.__D_Tree_backup, sides=self._insert.sides,
+                                  wal=self._insert.wal, observer=observer)
+
+        # secondary indexes on column values
+        self._indexes = _ColumnIndexes(self.__MetaData, self.default_key, wal=self._insert.wal, observer=observer)
+
 
     def __check(self, row, column_):
         # check if data ,rows, columns exist in table, to prevent duplication.
         data_dict = None
         pass_id = _hash_(str(row))
         value = []
-        with open(self.__D_Tree_backup if _is_backup(file=self.__D_Tree) else self.__D_Tree, "rb") as r:
-            try:
-                while dictionary := pickle.load(r):
-                    if dictionary.__contains__(pass_id):
-                        dictionary = dictionary.__getitem__(pass_id)
-                        value = dictionary.split(':')
-                        break
-            except EOFError:
-                pass
+        if (dictionary := self._row_index.get(pass_id)) is not None:
+            value = dictionary.split(':')
 
         if value:
-            data_path = os.path.join(f"{self.__db}", f"_D_{value[0]}.pickle")
-            backup_data_path = os.path.join(f"{self.__db}", f"backup_D_{value[0]}.pickle")
-
-            with open(backup_data_path if _is_backup(file=data_path) else data_path, "rb") as R:
-                try:
-                    while data_dict := pickle.load(R):
-                        if data_dict.__contains__(_hash_(str(row))):
-                            data_dict = data_dict.__getitem__(_hash_(str(row)))
-                            break
-                except EOFError:
-                    data_dict = None
-                    value = []
+            # only the column groups of the inserted columns are read
+            records = self._insert.fetch(value[0], set(keys := self._insert.keys(pass_id, column_)))
+            if not (data_dict := self._insert.decode_rows(records[key] for key in keys if key in records)):
+                data_dict = None
+                value = []
 
             if data_dict is not None:
                 # check if a column already exists
-                data_dict = eval(_decrypt(data_dict, self.default_key))
                 for col in column_:
                     if data_dict[f"{row}"].__contains__(str(col)):
                         raise dbTableError(
@@ -621,56 +3334,42 @@ class Generate(_Location):
         if (check_id_state := self.__check(row, columns))[0]:
             # update
             table_dict = check_id_state[1]
+            old_cells = dict(table_dict[f"{row}"])
             [table_dict[f"{row}"].__setitem__(str(columns[i]), data[i]) for i in range(len(data))]
-            self.__insert.insert(_data_=table_dict, row=row, update=True, path=check_id_state[2])
+            self._insert.insert(_data_=table_dict, row=row, update=True, path=check_id_state[2], columns=columns)
             # update=True means update or add to a row that already exists
+            self._indexes.change([(_hash_(str(row)), old_cells, table_dict[f"{row}"])])
         else:
-            fb_state_ = _is_backup(file=self.__row_collections)
-            _file_ = self.__row_collections_backup if fb_state_ else self.__row_collections
-            os.chmod(_file_, stat.S_IWRITE)
-            with open(_file_, "ab") as a:
-                pickle.dump(_encrypt(str(row), self.default_key), a)
-            os.chmod(_file_, stat.S_IREAD)
+            self._insert.sides.append(file=self.__row_collections, backup=self.__row_collections_backup,
+                                       records=[self._insert.row_record(row)])
 
             table_dict = {f"{row}": dict()}
             [table_dict[f"{row}"].__setitem__(str(columns[i]), data[i]) for i in range(len(data))]
 
             # insert
-            id_path = self.__insert.insert(_data_=table_dict, row=row)  # update=False (default) means a new row
+            id_path = self._insert.insert(_data_=table_dict, row=row)  # update=False (default) means a new row
             # insert the data dictionary in db files and return its path
-            with open(self.__Track, 'rb') as r:
-                track_dict = pickle.load(r)
-
-            counter = track_dict["tree_track"]
-            if counter == 1000:
-                # Table limit (1k rows) for speed and efficiency
-                raise dbTableError("you have reached table limit of one Thousand rows.")
-
-            self.__insert.track(key="tree_track")
+            self._insert.track(key="tree_track")
             # D-Tree data scheme {"hashed row": path}
             (tree_dict := dict()).__setitem__(_hash_(str(row)), id_path)
+            self._insert.sides.append(file=self.__D_Tree, backup=self.__D_Tree_backup, records=[tree_dict])
+            self._row_index.add(_hash_(str(row)), id_path)
+            self._indexes.change([(_hash_(str(row)), None, table_dict[f"{row}"])])
 
-            fb_state = _is_backup(file=self.__D_Tree)
-
-            file = self.__D_Tree_backup if fb_state else self.__D_Tree
-            os.chmod(file, stat.S_IWRITE)
-            with open(file, "ab") as a:
-                pickle.dump(tree_dict, a)
-            os.chmod(file, stat.S_IREAD)
-
-    def insert(self, data, row=None, columns=None):
+    def __table_state(self):
         try:
             # check Table State
-            table_state = _XML(self.__XML_ts).access()
-            ts_column = table_state[0]
-
-            if table_state[1] != _hash_(self.default_key):
-                # check is the encryption key is valid
-                raise dbTableError(f"Access denied, the encryption key {self.default_key} "
-                                   f"is not valid for table {self.__TableName}.")
+            ts_column, hashed_key = self._xml.access()
         except Exception:
-            raise dbTableError(f"No such Table {self.__TableName}")
+            raise dbTableError(f"No such Table {self._table_name}")
 
+        if hashed_key != _hash_(self.default_key):
+            # check is the encryption key is valid
+            raise KeyError(f"Access denied, the encryption key {self.default_key} "
+                           f"is not valid for table {self._table_name}.")
+        return ts_column
+
+    def __convert(self, data, row, columns, ts_column):
         # Converting the input
 
         columns = (columns,) if isinstance(columns, str) else (str(columns),) if isinstance(columns, int) else columns
@@ -706,7 +3405,340 @@ class Generate(_Location):
             """ index_tracker gives a list of the column's index that does not exist in table's columns (ts_column)"""
 
             non_existed_columns = [columns[i] for i in index_tracker]
-            raise dbTableError(f"{non_existed_columns} does not exist in table {self.__TableName}'s columns"
+            raise dbTableError(f"{non_existed_columns} does not exist in table {self._table_name}'s columns"
                                f"\n available columns:  {ts_column}")
 
+        return data, row, columns
+
+    @_writes
+    def insert(self, data, row=None, columns=None):
+        ts_column = self.__table_state()
+        data, row, columns = self.__convert(data, row, columns, ts_column)
         self._db_(data, row, columns)
+
+    @_writes
+    def insert_many(self, rows):
+        """
+        Insert many rows at once, rows is an iterable of (row, columns, data) tuples.
+        The table's state is checked once and every touched file is written once per call,
+        instead of once per row.
+        """
+        ts_column = self.__table_state()
+
+        batch = dict()
+        for row, columns, data in rows:
+            data, row, columns = self.__convert(data, row, columns, ts_column)
+            cells = batch.setdefault(row, dict())
+            for i in range(len(data)):
+                if cells.__contains__(str(columns[i])):
+                    raise dbTableError(f"the cell is already available for column: {columns[i]} and row: {row} ")
+                cells.__setitem__(str(columns[i]), data[i])
+
+        new_rows = []
+        segments = dict()
+        for row, cells in batch.items():
+            if (path := self._row_index.get(_hash_(str(row)))) is not None:
+                segments.setdefault(path.split(':')[0], []).append((row, cells, path))
+            else:
+                new_rows.append((row, {f"{row}": cells}))
+
+        # update or add to rows that already exist, reading each _D_ file once
+        updates = []
+        index_changes = []
+        for d, entries in segments.items():
+            # only the column groups of the inserted columns are read and written
+            records = self._insert.fetch(d, {key for row, cells, _ in entries
+                                              for key in self._insert.keys(_hash_(str(row)), cells)})
+            for row, cells, path in entries:
+                keys = self._insert.keys(_hash_(str(row)), cells)
+                if not (table_dict := self._insert.decode_rows(records[key] for key in keys if key in records)):
+                    table_dict = {f"{row}": dict()}
+                for col in cells:
+                    if table_dict[f"{row}"].__contains__(col):
+                        raise dbTableError(f"the cell is already available for column: {col} and row: {row} ")
+                index_changes.append((_hash_(str(row)), dict(table_dict[f"{row}"]), table_dict[f"{row}"]))
+                table_dict[f"{row}"].update(cells)
+                updates.append((row, table_dict, path, tuple(cells)))
+
+        if updates:
+            self._insert.update_many(updates)
+
+        if not new_rows:
+            self._indexes.change(index_changes)
+            return
+
+        self._insert.sides.append(file=self.__row_collections, backup=self.__row_collections_backup,
+                                   records=[self._insert.row_record(row) for row, _ in new_rows])
+
+        # insert, Track's tree_track is updated with the new paths
+        id_paths = self._insert.insert_many(new_rows)
+
+        tree_entries = [(_hash_(str(row)), id_path) for (row, _), id_path in zip(new_rows, id_paths)]
+        self._insert.sides.append(file=self.__D_Tree, backup=self.__D_Tree_backup,
+                                   records=[{pass_id: id_path} for pass_id, id_path in tree_entries])
+        self._row_index.extend(tree_entries)
+        self._indexes.change(index_changes + [(_hash_(str(row)), None, table_dict[f"{row}"])
+                                               for row, table_dict in new_rows])
+
+    @_observed_by
+    def import_csv(self, file, batch_size=1000):
+        """
+        Insert the rows of a CSV file (a path or a file open in text mode) as made by Extract.export_csv,
+        a header row, column-1, ... and a line per row, empty fields are skipped and the cells are str.
+        The file is read as it's inserted, batch_size rows per insert_many. Returns the number of rows.
+        """
+        with _text_file(file, "r") as r:
+            reader = csv.reader(r)
+            if (header := next(reader, None)) is None or header[:1] != ["row"]:
+                raise dbTableError("The CSV file must start with the header row, column-1, ... .")
+            names = self.__columns()
+            columns = [names.get(name, name) for name in header[1:]]
+            return self.__import(((fields[0], {column: data for column, data in zip(columns, fields[1:]) if data})
+                                  for fields in reader if fields), batch_size)
+
+    @_observed_by
+    def import_jsonl(self, file, batch_size=1000):
+        """
+        Insert the rows of a JSON Lines file (a path or a file open in text mode) as made by
+        Extract.export_jsonl, a line {"row": row, "cells": {column: data}} per row.
+        The file is read as it's inserted, batch_size rows per insert_many. Returns the number of rows.
+        """
+        with _text_file(file, "r") as r:
+            columns = self.__columns()
+
+            def rows():
+                for line in r:
+                    if line.strip():
+                        record = json.loads(line)
+                        yield record["row"], {columns.get(column, column): data
+                                              for column, data in record["cells"].items()}
+            return self.__import(rows(), batch_size)
+
+    def __columns(self):
+        # {str name: column}, the names in a file are str and the table's columns may be int
+        return {str(column): column for column in self.__table_state()}
+
+    def __import(self, rows, batch_size):
+        # rows is an iterator of (row, {column: data}), the rows without cells are skipped
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise TypeError("Batch size must be a positive int, use the key argument batch_size= .")
+        rows = ((row, tuple(cells), tuple(cells.values())) for row, cells in rows if cells)
+        count = 0
+        while batch := list(islice(rows, batch_size)):
+            self.insert_many(batch)
+            count += len(batch)
+        return count
+
+
+class Table:
+    """
+    One handle on a table for inserts and reads, Generate and Extract in a single object.
+    The handle can be shared by many threads, reads run in parallel and writes one at a time,
+    between processes too.
+    """
+
+    def __init__(self, db_path=current_directory, db_name="_dbTables_", table_name=None, key=default_key,
+                 columns=None, cache_size=0, observer=None, mapped_segments=None, **options):
+        if columns is not None:
+            # makes the table if it doesn't exist
+            self.__generate = Generate(db_path=db_path, db_name=db_name, table_name=table_name, encrypt_key=key,
+                                       columns=columns, observer=observer, **options)
+        self.__extract = Extract(db_path=db_path, db_name=db_name, table_name=table_name, decrypt_key=key,
+                                 cache_size=cache_size, observer=observer, mapped_segments=mapped_segments)
+        if columns is None:
+            self.__generate = Generate(db_path=db_path, db_name=db_name, table_name=table_name, encrypt_key=key,
+                                       columns=tuple(self.__extract.fetchall_columns), observer=observer)
+        self.__location = dict(db_path=db_path, db_name=db_name, table_name=table_name, observer=observer)
+
+    def insert(self, data, row=None, columns=None):
+        self.__generate.insert(data, row=row, columns=columns)
+
+    def insert_many(self, rows):
+        self.__generate.insert_many(rows)
+
+    def import_csv(self, file, batch_size=1000):
+        return self.__generate.import_csv(file, batch_size=batch_size)
+
+    def import_jsonl(self, file, batch_size=1000):
+        return self.__generate.import_jsonl(file, batch_size=batch_size)
+
+    @contextmanager
+    def transaction(self, sync=True):
+        with self.__extract.transaction(sync=sync):
+            yield self
+
+    def rekey(self, old_key=None, new_key=None):
+        # the inserts go on with new_key
+        self.__extract.rekey(old_key=old_key, new_key=new_key)
+        self.__generate = Generate(encrypt_key=new_key, columns=tuple(self.__extract.fetchall_columns),
+                                   **self.__location)
+
+    def close(self):
+        # the WAL is written to the table's files and synced, the files kept open are closed
+        with self.__extract._lock.exclusive():
+            self.__extract._wal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.__extract)
+
+    def __getattr__(self, name):
+        # everything else is Extract's
+        if name.startswith("_Table__"):
+            raise AttributeError(name)
+        return getattr(self.__extract, name)
+
+
+_executor = None
+_executor_mutex = threading.Lock()
+
+
+def _async_executor():
+    # made on first use, shared by all the asyncio front-ends of the process
+    global _executor
+    with _executor_mutex:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=default_async_workers, thread_name_prefix="dbTable")
+        return _executor
+
+
+class _Async:
+    """
+    asyncio front-end of Extract or Generate, the calls run in a bounded thread pool so the event loop
+    isn't blocked by the files, pickle or the cipher.
+    Reads run in parallel (the table's lock is shared), the writes of an instance wait for each other
+    in the event loop, not in the executor's threads.
+    """
+
+    def __init__(self, table, executor=None):
+        self._table = table
+        self._executor = executor
+        self._writes = None
+
+    async def _run(self, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor or _async_executor(),
+                                                                partial(function, *args, **kwargs))
+
+    async def _write(self, function, *args, **kwargs):
+        if self._writes is None:
+            self._writes = asyncio.Lock()
+        async with self._writes:
+            return await self._run(function, *args, **kwargs)
+
+    async def _iterate(self, iterator, chunk=100):
+        # a scan, chunk items are taken from iterator at a time in the executor
+        read = None
+        try:
+            while True:
+                read = asyncio.get_running_loop().run_in_executor(self._executor or _async_executor(),
+                                                                  list, islice(iterator, chunk))
+                # shielded, a cancelled scan doesn't stop the thread that reads the chunk
+                if not (items := await asyncio.shield(read)):
+                    break
+                for item in items:
+                    yield item
+        finally:
+            if read is not None and not read.done():
+                # the iterator is still running in the executor, it's closed when the chunk is read
+                read.add_done_callback(lambda _: iterator.close())
+                await asyncio.wait([read])
+            else:
+                iterator.close()
+
+
+class AsyncExtract(_Async):
+    """
+    Extract with awaitable methods, the arguments are Extract's and executor (optional, a
+    concurrent.futures executor, by default a pool of default_async_workers threads).
+    Scans (select, iter_rows, iter_items) are async iterators.
+    """
+
+    def __init__(self, *args, executor=None, **kwargs):
+        super().__init__(Extract(*args, **kwargs), executor)
+
+    async def find(self, row=None, column=None):
+        return await self._run(self._table.find, row=row, column=column)
+
+    async def find_many(self, rows, columns=None):
+        return await self._run(self._table.find_many, list(rows), columns=columns)
+
+    async def check(self, row, column=None):
+        return await self._run(self._table.check, row, column=column)
+
+    async def find_by(self, column=None, value=None):
+        return await self._run(self._table.find_by, column=column, value=value)
+
+    async def row_stringify(self, row=None, indent=2, sort_keys=False):
+        return await self._run(self._table.row_stringify, row=row, indent=indent, sort_keys=sort_keys)
+
+    async def fetchall_rows(self):
+        return await self._run(lambda: self._table.fetchall_rows)
+
+    async def count(self):
+        # len() of the table
+        return await self._run(len, self._table)
+
+    async def update(self, data=None, row=None, column=None):
+        await self._write(self._table.update, data=data, row=row, column=column)
+
+    async def remove(self, row=None, column=None):
+        await self._write(self._table.remove, row=row, column=column)
+
+    async def drop_row(self, row=None):
+        await self._write(self._table.drop_row, row=row)
+
+    async def create_index(self, column=None):
+        await self._write(self._table.create_index, column=column)
+
+    async def compact(self):
+        await self._write(self._table.compact)
+
+    async def rekey(self, old_key=None, new_key=None):
+        await self._write(self._table.rekey, old_key=old_key, new_key=new_key)
+
+    async def export_csv(self, file, columns=None):
+        return await self._run(self._table.export_csv, file, columns=columns)
+
+    async def export_jsonl(self, file, columns=None):
+        return await self._run(self._table.export_jsonl, file, columns=columns)
+
+    def select(self, columns=None, where=None, limit=None):
+        return self._iterate(self._table.select(columns=columns, where=where, limit=limit))
+
+    def iter_rows(self):
+        return self._iterate(self._table.iter_rows())
+
+    def iter_items(self, columns=None):
+        return self._iterate(self._table.iter_items(columns=columns))
+
+    @property
+    def fetchall_columns(self):
+        return self._table.fetchall_columns
+
+
+class AsyncGenerate(_Async):
+    """ Generate with awaitable inserts, the arguments are Generate's and executor, see AsyncExtract """
+
+    def __init__(self, *args, executor=None, **kwargs):
+        super().__init__(Generate(*args, **kwargs), executor)
+
+    async def insert(self, data, row=None, columns=None):
+        await self._write(self._table.insert, data, row=row, columns=columns)
+
+    async def insert_many(self, rows):
+        # rows is consumed in the executor, an iterable made by the caller is read there
+        await self._write(self._table.insert_many, rows)
+
+    async def import_csv(self, file, batch_size=1000):
+        return await self._write(self._table.import_csv, file, batch_size=batch_size)
+
+    async def import_jsonl(self, file, batch_size=1000):
+        return await self._write(self._table.import_jsonl, file, batch_size=batch_size)
+
+    async def create_index(self, column=None):
+        await self._write(self._table.create_index, column=column)